@@ -1,10 +1,34 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import google.generativeai as genai
-import json
-import os
-import re
-from datetime import datetime
+import random
+import time
+
+from generator import (
+    GENERATION_CONFIG,
+    MODEL_NAME,
+    QUESTION_TYPES,
+    TOPICS,
+    delete_history_file,
+    generate_problem_set,
+    generate_problem_set_stream,
+    get_history_files,
+    load_from_history,
+    regenerate_part,
+    save_to_history,
+    update_history_entry,
+)
+from cache import get_cache
+from prefetch import PREFETCH_ENABLED, PrefetchPool, make_pool_key
+from exam import FULL_EXAM_TYPE, assemble_full_exam
+from history_store import get_history_store
+from vocab_index import get_vocab_index
+from singleflight import get_single_flight
+from ratelimit import get_api_limiter
+from providers import get_router, needs_gemini_key
+from render import build_passage_html, build_vocab_html, vocab_items
+from metrics import get_metrics, span
+from question_types import prompt_size_report
+from attempts import analyze, get_attempt_log, grade_answers, to_csv
 
 # --- Page Config ---
 st.set_page_config(
@@ -13,188 +37,16 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- Functions ---
-def save_to_history(data, topic):
-    if not os.path.exists('history'):
-        os.makedirs('history')
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_topic = re.sub(r'[^a-zA-Z0-9가-힣]', '_', topic)
-    filename = f"history/{timestamp}_{safe_topic}.json"
-    
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    return filename
-
-def load_from_history(filename):
-    with open(filename, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-def get_history_files():
-    if not os.path.exists('history'):
-        return []
-    files = [f for f in os.listdir('history') if f.endswith('.json')]
-    files.sort(reverse=True) # Newest first
-    return files
-
-def delete_history_file(filename):
-    if os.path.exists(filename):
-        os.remove(filename)
-
-def generate_problem_set(api_key, school_level, grade, topic, difficulty_level, question_type):
-    # Configure Gemini API
-    genai.configure(api_key=api_key)
-    
-    # Using 'gemini-2.5-flash' as it is the current standard available model.
-    model_name = 'gemini-2.5-flash' 
-    model = genai.GenerativeModel(model_name, generation_config={"response_mime_type": "application/json"})
-    
-    difficulty_guide = ""
-    if school_level == "중학교":
-        if grade == "1학년":
-            difficulty_guide = "Middle School Grade 1 Level. Length: 120-150 words. Vocab: ~800 words. Basic sentence structures."
-        elif grade == "2학년":
-            difficulty_guide = "Middle School Grade 2 Level. Length: 150-200 words. Vocab: ~1000 words. Comparison, Infinitives."
-        else: # 3학년
-            difficulty_guide = "Middle School Grade 3 Level. Length: 200-250 words. Vocab: ~1250 words. Pre-High School difficulty. Relative clauses, passive voice."
-    else: # 고등학교
-        if grade == "1학년":
-            difficulty_guide = "High School Grade 1 Level. Length: 250-350 words. Vocab: ~1800 words. Mock Exam standard. Complex sentence structures."
-        elif grade == "2학년":
-            difficulty_guide = "High School Grade 2 Level. Length: 300-400 words. Vocab: ~2500 words. Abstract topics, Participial constructions."
-        else: # 3학년
-            difficulty_guide = "CSAT (SuNeung) Level. Length: 350-500 words. Vocab: 5000-8000 words level. Highly abstract, academic topics. Complex syntax. Vocabulary based on EBS SuNeung Teukgang."
-
-    # Logic to adjust prompt based on CSAT Question Type
-    question_count_req = "5"
-    type_instruction = ""
-    
-    if "종합" in question_type:
-        question_count_req = "5"
-        type_instruction = """
-        - Create exactly 5 multiple-choice questions (5 options each) with VARIED formats (Avoid too many blanks):
-          - Q1: Main Idea/Title (Subject/Title).
-          - Q2: Detail/Content Match (Correct/Incorrect statement).
-          - Q3: Grammar (Error Finding). **Highlight 5 parts in the passage as (1)~(5)**. The options MUST include the highlighted word (e.g., "(1) live").
-          - Q4: Vocabulary Appropriateness. **Highlight 5 words in the passage as (a)~(e)**. The options MUST include the highlighted word (e.g., "(a) happy").
-          - Q5: Blank Inference. **Insert exactly ONE blank (_______)** in the passage. The question text should be simple (e.g., "다음 빈칸에 들어갈 말로 가장 적절한 것은?") WITHOUT quoting the sentence again.
-        """
-    elif "41-42" in question_type:
-        question_count_req = "2"
-        type_instruction = f"""
-        - Create exactly 2 multiple-choice questions (Standard CSAT Q41-42 Format):
-          - Q1: Title Inference (제목 추론)
-          - Q2: Vocabulary appropriateness in context (문맥상 낱말의 쓰임) - **Mark target words as (a), (b), (c), (d), (e) in the passage.**
-        - Passage Length: 500-600 words (Long Passage).
-        """
-    elif "43-45" in question_type:
-        question_count_req = "3"
-        type_instruction = f"""
-        - Create exactly 3 multiple-choice questions (Standard CSAT Q43-45 Format):
-          - Passage Structure: Divide the story into (A), (B), (C), (D) paragraphs.
-          - Q1: Order of paragraphs (B-D) following (A).
-          - Q2: Pointing Inference (Targeting pronouns a,b,c,d,e) - **Mark pronouns clearly in the text.**
-          - Q3: Content Match/Mismatch (내용 일치/불일치).
-        - Passage Style: Narrative/Storytelling.
-        """
-    else:
-        # Single Question Types (18-40)
-        question_count_req = "1"
-        type_instruction = f"""
-        - **PRIMARY GOAL**: Create exactly 1 multiple-choice question modeled after **{question_type}**.
-        - **Passage Style**: Must perfectly suit the chosen type (e.g., for '빈칸추론', use high abstraction and logical gaps; for '심경', use descriptive/narrative tone).
-        - **Question**:
-          - Create ONE perfect replica of the {question_type}.
-          - **CRITICAL**: If the question type involves a blank ( 빈칸 ), you MUST insert the '_______' marker directly into the passage text.
-          - **CRITICAL - Standard Formatting**:
-            - **Grammar (어법)**: Mark targets in the passage as **(1) word**, **(2) word**, etc. (Number before word).
-            - **Vocabulary (어휘)**: Mark targets in the passage as **(a) word**, **(b) word**, etc. (Letter before word).
-        """
-        # Override difficulty for specific types
-        if "빈칸" in question_type or "순서" in question_type or "삽입" in question_type or "함축" in question_type:
-             difficulty_level += " (Upgrade to HARD/KILLER due to Question Type)"
-
-    prompt = f"""
-    You are an expert English teacher for Korean students, specialized in creating content for the Korean CSAT (Sooneung) and Mock Exams.
-    Create a reading passage and QUESTIONS based on the following STRICT criteria:
-    
-    - **Topic**: {topic}
-    - **Target Audience**: Korean {school_level} student, {grade}
-    - **Base Difficulty Standard**: {difficulty_guide}
-    - **Selected Question Type**: {question_type}
-    - **Specific Difficulty Adjustment**: {difficulty_level} (within the grade level)
-    
-    **Requirements**:
-    1. Write an English reading passage that perfectly matches the requested difficulty and style.
-    2. **Question Structure**:
-       {type_instruction}
-    3. **CRITICAL - Handling Blanks/Context**:
-       - If a question asks to fill in a blank (Usage/Expression/Blank Inference), and the blank is NOT in the main passage, **you MUST include the specific sentence with the '_______' marker inside the 'question' field.**
-    4. Provide the correct answer and a detailed explanation in Korean for each question.
-    5. Extract 5-10 difficult vocabulary words or idioms from the passage and provide their Korean meanings.
-    
-    **Output Format**:
-    Return ONLY a valid JSON object with the following structure:
-    {{
-        "title": "Passage Title",
-        "passage": "Full text...",
-        "questions": [
-            {{
-                "type": "Type Name",
-                "question": "Question Text...",
-                "options": ["1. A", "2. B", "3. C", "4. D", "5. E"],
-                "answer": "3",
-                "explanation": "..."
-            }}
-        ],
-        "vocabulary": [
-            {{ "word": "example word", "meaning": "예시 단어 뜻" }},
-            {{ "word": "idiom", "meaning": "숙어 뜻" }}
-        ]
-    }}
-    """
-
-    try:
-        response = model.generate_content(prompt)
-        text_response = response.text
-        
-        # Clean up JSON string (Remove Markdown code blocks if present)
-        if "```json" in text_response:
-            text_response = text_response.split("```json")[1].split("```")[0]
-        elif "```" in text_response:
-            text_response = text_response.split("```")[1].split("```")[0]
-            
-        # Remove trailing commas which cause JSON errors
-        text_response = re.sub(r',\s*]', ']', text_response)
-        text_response = re.sub(r',\s*}', '}', text_response)
-        
-        return json.loads(text_response)
-    except Exception as e:
-        error_msg = str(e)
-        if "404" in error_msg:
-            try:
-                available_models = []
-                for m in genai.list_models():
-                    if 'generateContent' in m.supported_generation_methods:
-                        available_models.append(m.name)
-                return {"error": f"지정한 모델을 찾을 수 없습니다. (404 Error)\n\n현재 사용 가능한 모델 목록:\n{', '.join(available_models)}\n\n상세 에러: {error_msg}"}
-            except Exception as list_e:
-                return {"error": f"모델을 찾을 수 없으며, 목록 조회도 실패했습니다.\n{error_msg}"}
-        return {"error": str(e)}
-
 # --- Constants ---
-TOPICS = [
-    "환경 문제 (Environmental Issues)",
-    "과학 기술 (Science & Technology)",
-    "인공지능과 윤리 (AI & Ethics)",
-    "문화적 다양성 (Cultural Diversity)",
-    "역사와 전통 (History & Tradition)",
-    "경제와 소비 (Economy & Consumption)",
-    "심리학과 인간 행동 (Psychology & Human Behavior)",
-    "예술과 문학 (Art & Literature)",
-    "진로와 직업 (Career & Jobs)",
-    "건강과 운동 (Health & Exercise)"
-]
+RANDOM_TOPIC = "🎲 아무 추천 주제나 (준비된 문제 바로 받기)"
+
+@st.cache_resource
+def get_prefetch_pool(api_key):
+    # One pool per API key in this server process, shared by the sessions
+    # using that key, so nobody's quota pays for another user's sets
+    if not PREFETCH_ENABLED or not api_key:
+        return None
+    return PrefetchPool(generate_problem_set, TOPICS, api_key)
 
 # --- Session State Initialization ---
 if 'generated_content' not in st.session_state:
@@ -203,6 +55,20 @@ if 'graded' not in st.session_state:
     st.session_state.graded = False
 if 'is_generating' not in st.session_state:
     st.session_state.is_generating = False
+if 'generated_meta' not in st.session_state:
+    st.session_state.generated_meta = {}
+if 'history_id' not in st.session_state:
+    st.session_state.history_id = None
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 1
+
+def show_problem_set(data, meta, history_id=None):
+    # meta: topic / school_level / grade / question_type / difficulty it was made with
+    st.session_state.generated_content = data
+    st.session_state.generated_meta = meta
+    st.session_state.history_id = history_id
+    st.session_state.graded = False
+    st.session_state.quiz_started_at = time.time()
 
 def start_generation():
     st.session_state.is_generating = True
@@ -214,7 +80,11 @@ def stop_generation():
 st.markdown("### 🦄 워니비니 영어 도우미")
 
 # --- Tabs: Settings & History ---
-tab1, tab2 = st.tabs(["⚙️ 문제 생성 (Generator)", "📂 히스토리 (History)"])
+admin_password = st.secrets["ADMIN_PASSWORD"] if "ADMIN_PASSWORD" in st.secrets else None
+tab_names = ["⚙️ 문제 생성 (Generator)", "📂 히스토리 (History)", "📚 단어장 (Vocabulary)"]
+if admin_password:
+    tab_names.append("📈 성능 (Admin)")
+tab1, tab2, tab3, *admin_tabs = st.tabs(tab_names)
 
 # --- Tab 1: Settings & Generator ---
 with tab1:
@@ -228,6 +98,8 @@ with tab1:
         else:
             api_key = st.text_input("Google Gemini API Key를 입력하세요", type="password", disabled=input_disabled)
             st.caption("매번 입력하기 귀찮다면 `.streamlit/secrets.toml` 파일에 키를 저장하세요.")
+        st.text_input("내 히스토리 공간 (선택)", key="namespace", placeholder="예: 3학년 2반 김민수",
+                      help="입력하면 저장과 히스토리 목록이 이 공간으로 나뉩니다. 비워 두면 공용 히스토리를 사용합니다.")
         
         # Layout: 3 Columns for School, Grade, Difficulty
         col1, col2, col3 = st.columns(3)
@@ -242,20 +114,7 @@ with tab1:
         # Question Type Selection
         question_type = st.selectbox(
             "수능/모의고사 유형 선택 (Type)",
-            [
-                "종합 (General Practice) - 5문제",
-                "18-19번: 목적/심경 (1문제)",
-                "20-24번: 대의파악 (주제/제목/요지) (1문제)",
-                "21번: 함축의미 추론 (1문제)",
-                "29번: 어법 (Grammar) (1문제)",
-                "30번: 어휘 (Vocabulary) (1문제)",
-                "31-34번: 빈칸추론 (Killer) (1문제)",
-                "35번: 흐름과 관계없는 문장 (1문제)",
-                "36-39번: 글의 순서/문장 삽입 (1문제)",
-                "40번: 요약문 완성 (1문제)",
-                "41-42번: 장문 독해 (2문제)",
-                "43-45번: 복합 장문 (3문제)"
-            ],
+            QUESTION_TYPES + [FULL_EXAM_TYPE],
             disabled=input_disabled
         )
         
@@ -267,38 +126,131 @@ with tab1:
         if topic_mode == "직접 입력":
             topic = st.text_input("주제를 입력하세요", placeholder="예: 우주 여행, K-Pop, 기후 변화", disabled=input_disabled)
         else:
-            topic_options = ["(주제를 선택해주세요)"] + TOPICS
+            # The random pick only promises a ready set when a pool keeps some
+            topic_options = ["(주제를 선택해주세요)"] + ([RANDOM_TOPIC] if get_prefetch_pool(api_key) else []) + TOPICS
             selected_topic = st.selectbox("추천 주제를 선택하세요", topic_options, disabled=input_disabled)
             if selected_topic != "(주제를 선택해주세요)":
                 topic = selected_topic
         
+        use_cache = st.checkbox("같은 조건으로 만든 문제가 있으면 바로 불러오기 (캐시 사용)", value=True, disabled=input_disabled)
+        use_streaming = st.checkbox("생성되는 대로 바로 보여주기 (스트리밍)", value=True, disabled=input_disabled)
+        
         st.write("")
         
         if st.session_state.is_generating:
             st.button("⛔ 생성 중단 (Stop)", on_click=stop_generation, type="primary", use_container_width=True)
         else:
             st.button("📝 문제 생성하기", on_click=start_generation, type="primary", use_container_width=True)
+        
+        cache_stats = get_cache().stats()
+        st.caption(f"⚡ 캐시 적중 {cache_stats['hits']}회 (메모리 {cache_stats['memory_hits']} / 디스크 {cache_stats['disk_hits']}) · 미적중 {cache_stats['misses']}회")
+        if get_prefetch_pool(api_key):
+            pool_status = get_prefetch_pool(api_key).status()
+            pool_key = make_pool_key(school_level, grade, difficulty_level, question_type)
+            st.caption(f"🎲 지금 조건으로 준비된 추천 주제 문제: {pool_status['ready'].get(pool_key, 0)}개 (준비 중 {pool_status['pending'].get(pool_key, 0)}개)")
 
-if not api_key:
+if not api_key and needs_gemini_key():
     st.warning("☝️ 위 설정 메뉴에서 Gemini API Key를 입력하거나 secrets.toml에 설정해주세요.")
     st.markdown("[Google AI Studio](https://aistudio.google.com/)에서 무료 키를 발급받을 수 있습니다.")
     st.stop()
 
 # --- Generation Logic ---
-if st.session_state.is_generating:
+prefetch_pool = get_prefetch_pool(api_key)
+
+if st.session_state.is_generating and question_type == FULL_EXAM_TYPE:
+    # Every item type is generated in parallel; each passage gets its own topic
+    # unless one was typed in directly.
+    if topic_mode == "직접 입력" and topic:
+        exam_topics = [topic]
+    else:
+        exam_topics = random.sample(TOPICS, len(TOPICS))
+    progress_bar = st.progress(0.0, text="모의고사 문항을 동시에 생성하고 있습니다...")
+
+    def report_exam_progress(done, total, number, item_type, ok):
+        mark = "✅" if ok else "❌"
+        progress_bar.progress(done / total, text=f"{mark} {number}번 완료 ({done}/{total}) - {item_type}")
+
+    result = None
+    try:
+        result = assemble_full_exam(generate_problem_set, api_key, school_level, grade, exam_topics, difficulty_level,
+                                    progress=report_exam_progress)
+        if "error" in result:
+            st.error(f"오류가 발생했습니다: {result['error']}")
+        else:
+            show_problem_set(result, {"topic": "실전 모의고사", "school_level": school_level, "grade": grade,
+                                      "question_type": question_type, "difficulty": difficulty_level})
+    except Exception as e:
+        st.error(f"예상치 못한 오류 발생: {e}")
+    finally:
+        st.session_state.is_generating = False
+    if result is not None and st.session_state.generated_content is result:
+        st.rerun()
+elif st.session_state.is_generating:
+    prefetched = None
+    if topic and topic_mode == "추천 주제 선택" and prefetch_pool:
+        pool_key = make_pool_key(school_level, grade, difficulty_level, question_type)
+        prefetch_pool.record_request(pool_key)
+        prefetched = prefetch_pool.pop(pool_key, None if topic == RANDOM_TOPIC else topic)
+    if topic == RANDOM_TOPIC:
+        topic = prefetched["topic"] if prefetched else random.choice(TOPICS)
+
     if not topic:
         st.error("주제를 입력하거나 선택해주세요.")
         st.session_state.is_generating = False
+    elif prefetched:
+        # Served from the background pool, no waiting
+        show_problem_set(prefetched["data"], {"topic": topic, "school_level": school_level, "grade": grade,
+                                              "question_type": question_type, "difficulty": difficulty_level})
+        st.session_state.is_generating = False
+        st.rerun()
+    elif use_streaming:
+        # Render each part in place as soon as the model finishes it
+        st.info("문제를 생성하고 있습니다... 완성된 부분부터 바로 보여드립니다.")
+        title_placeholder = st.empty()
+        passage_placeholder = st.empty()
+        questions_area = st.container()
+        result = None
+        try:
+            for event in generate_problem_set_stream(api_key, school_level, grade, topic, difficulty_level, question_type, use_cache=use_cache,
+                                                     namespace=st.session_state.get("namespace", "").strip()):
+                if event[0] == "field" and event[1] == "title":
+                    title_placeholder.subheader(f"📖 {event[2]}")
+                elif event[0] == "field" and event[1] == "passage":
+                    passage_placeholder.markdown(build_passage_html(event[2]), unsafe_allow_html=True)
+                elif event[0] == "question":
+                    idx, q = event[1], event[2]
+                    with questions_area:
+                        st.markdown(f"**{idx+1}.** {q.get('question', '').strip().replace('**', '')}")
+                        for option in q.get('options', []):
+                            st.markdown(f"- {option}")
+                elif event[0] == "done":
+                    result = event[1]
+                elif event[0] == "error":
+                    st.error(f"오류가 발생했습니다: {event[1]}")
+
+            if result is not None:
+                # A near-duplicate served from history keeps its history id
+                show_problem_set(result, {"topic": topic, "school_level": school_level, "grade": grade,
+                                          "question_type": question_type, "difficulty": difficulty_level},
+                                 history_id=result.get("duplicate_of"))
+        except Exception as e:
+            st.error(f"예상치 못한 오류 발생: {e}")
+        finally:
+            st.session_state.is_generating = False
+        if result is not None:
+            st.rerun()
     else:
         with st.spinner("문제를 생성하고 있습니다... (약 10~20초 소요)"):
             try:
-                result = generate_problem_set(api_key, school_level, grade, topic, difficulty_level, question_type)
+                result = generate_problem_set(api_key, school_level, grade, topic, difficulty_level, question_type, use_cache=use_cache,
+                                              namespace=st.session_state.get("namespace", "").strip())
                 
                 if "error" in result:
                     st.error(f"오류가 발생했습니다: {result['error']}")
                 else:
-                    st.session_state.generated_content = result
-                    st.session_state.graded = False
+                    show_problem_set(result, {"topic": topic, "school_level": school_level, "grade": grade,
+                                              "question_type": question_type, "difficulty": difficulty_level},
+                                     history_id=result.get("duplicate_of"))
             except Exception as e:
                 st.error(f"예상치 못한 오류 발생: {e}")
             finally:
@@ -308,78 +260,212 @@ if st.session_state.is_generating:
 # --- Tab 2: History Logic ---
 with tab2:
     st.markdown("### 📂 저장된 문제 목록")
-    history_files = get_history_files()
+    history_store = get_history_store()
+    history_namespace = st.session_state.get("namespace", "").strip()
+    
+    # Filters (any change jumps back to the first page)
+    def reset_history_page():
+        st.session_state.history_page = 1
+    
+    history_search = st.text_input("🔍 지문/제목 검색", placeholder="예: climate, robot", on_change=reset_history_page)
+    col_f1, col_f2, col_f3, col_f4 = st.columns(4)
+    with col_f1:
+        filter_school = st.selectbox("학교", ["전체"] + history_store.distinct("school_level", history_namespace), on_change=reset_history_page)
+    with col_f2:
+        filter_grade = st.selectbox("학년", ["전체"] + history_store.distinct("grade", history_namespace), on_change=reset_history_page)
+    with col_f3:
+        filter_type = st.selectbox("유형", ["전체"] + history_store.distinct("question_type", history_namespace), on_change=reset_history_page)
+    with col_f4:
+        filter_topic = st.selectbox("주제", ["전체"] + history_store.distinct("topic", history_namespace), on_change=reset_history_page)
+    
+    history_page_size = 20
+    history_entries, history_total = get_history_files(
+        page=st.session_state.history_page,
+        page_size=history_page_size,
+        search=history_search,
+        namespace=history_namespace,
+        school_level=None if filter_school == "전체" else filter_school,
+        grade=None if filter_grade == "전체" else filter_grade,
+        question_type=None if filter_type == "전체" else filter_type,
+        topic=None if filter_topic == "전체" else filter_topic,
+    )
+    # A delete or a namespace change can leave the page past the end
+    history_pages = max(1, (history_total + history_page_size - 1) // history_page_size)
+    if st.session_state.history_page > history_pages:
+        st.session_state.history_page = history_pages
+        st.rerun()
     
-    if not history_files:
-        st.info("아직 저장된 문제가 없습니다. '문제 생성' 탭에서 문제를 만들고 저장해 보세요!")
+    if not history_entries:
+        if history_total or history_search or any(f != "전체" for f in (filter_school, filter_grade, filter_type, filter_topic)):
+            st.info("조건에 맞는 문제가 없습니다.")
+        else:
+            st.info("아직 저장된 문제가 없습니다. '문제 생성' 탭에서 문제를 만들고 저장해 보세요!")
     else:
-        selected_file = st.selectbox("불러올 파일을 선택하세요", history_files)
+        def format_history_entry(entry):
+            label = f"{entry['created_at'].replace('T', ' ')[:16]} · {entry['topic'] or 'Untitled'}"
+            if entry['question_type']:
+                label += f" · {entry['question_type']}"
+            if entry['score'] is not None:
+                label += f" · {int(entry['score'])}점"
+            return label
+        
+        selected_entry = st.selectbox("불러올 문제를 선택하세요", history_entries, format_func=format_history_entry)
+        
+        col_p1, col_p2, col_p3 = st.columns([0.2, 0.6, 0.2])
+        with col_p1:
+            if st.button("◀ 이전", disabled=st.session_state.history_page <= 1):
+                st.session_state.history_page -= 1
+                st.rerun()
+        with col_p2:
+            st.caption(f"{st.session_state.history_page} / {history_pages} 페이지 (총 {history_total}개)")
+        with col_p3:
+            if st.button("다음 ▶", disabled=st.session_state.history_page >= history_pages):
+                st.session_state.history_page += 1
+                st.rerun()
         
         col_h1, col_h2 = st.columns([0.2, 0.8])
         with col_h1:
             if st.button("📂 불러오기 (Load)"):
                 try:
-                    data = load_from_history(f"history/{selected_file}")
-                    st.session_state.generated_content = data
-                    st.session_state.graded = False
+                    data = load_from_history(selected_entry['id'])
+                    meta = {k: selected_entry[k] for k in ("topic", "school_level", "grade", "question_type", "difficulty")}
+                    show_problem_set(data, meta, history_id=selected_entry['id'])
                     st.success(f"불러오기 완료!")
                     st.rerun()
                 except Exception as e:
                     st.error(f"파일 불러오기 실패: {e}")
         with col_h2:
             if st.button("🗑️ 삭제 (Delete)"):
-                delete_history_file(f"history/{selected_file}")
+                delete_history_file(selected_entry['id'])
+                if st.session_state.history_id == selected_entry['id']:
+                    st.session_state.history_id = None
                 st.success("삭제되었습니다.")
                 st.rerun()
 
-# --- Display Content ---
-if st.session_state.generated_content:
-    result = st.session_state.generated_content
-    
-    # Save Button (Top Right of Content)
-    col_s1, col_s2 = st.columns([0.8, 0.2])
-    with col_s2:
-        if st.button("💾 저장 (Save)"):
-            file_path = save_to_history(result, topic if topic else "Untitled")
-            st.toast(f"저장 완료! ({os.path.basename(file_path)})", icon="✅")
+# --- Tab 3: Vocabulary ---
+with tab3:
+    vocab_index = get_vocab_index()
+    st.markdown(f"### 📚 전체 단어장 ({len(vocab_index)}개 단어)")
+    vocab_query = st.text_input("단어 찾기 (앞부분 또는 비슷한 철자)", placeholder="예: sustain")
+    if vocab_query.strip():
+        matches = vocab_index.search(vocab_query)
+        if matches:
+            st.dataframe(
+                [{"word": m["word"], "meaning": " / ".join(m["meanings"]), "sets": m["sets"]} for m in matches],
+                use_container_width=True, hide_index=True,
+            )
+            components.html(build_vocab_html(vocab_items([{"word": m["word"], "meaning": " / ".join(m["meanings"])}
+                                                          for m in matches])),
+                            height=len(matches) * 40 + 50, scrolling=True)
+        else:
+            st.info("일치하는 단어가 없습니다.")
 
-    # Display Passage with Box Style
-    st.divider()
-    st.subheader(f"📖 {result.get('title', 'Reading Passage')}")
-    
-    passage_text = result.get('passage', '')
-    # Convert Markdown to HTML for the box display
-    passage_text = passage_text.replace(chr(10), '<br>')
-    passage_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', passage_text) # Bold
-    passage_text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', passage_text) # Italic
-    
-    passage_html = f"""
-    <div style="
-        background-color: #FFFFFF;
-        padding: 25px;
-        border: 2px solid #333;
-        font-family: 'Times New Roman', serif;
-        font-size: 18px;
-        line-height: 1.8;
-        color: #000;
-        margin-bottom: 20px;
-    ">
-        {passage_text}
-    </div>
-    """
-    st.markdown(passage_html, unsafe_allow_html=True)
-    
-    st.divider()
-    
+    vocab_level = st.selectbox("학년별 빈출 단어", ["전체"] + vocab_index.levels())
+    vocab_level = None if vocab_level == "전체" else vocab_level
+    st.dataframe(vocab_index.ranking(vocab_level), use_container_width=True, hide_index=True)
+    st.download_button("⬇️ 단어장 내보내기 (CSV, 중복 제거)", vocab_index.deck_csv(vocab_level),
+                       file_name="vocabulary_deck.csv", mime="text/csv")
+
+# --- Tab 4: Admin (Metrics) ---
+# Only shown when ADMIN_PASSWORD is configured
+if admin_password:
+    with admin_tabs[0]:
+        if st.text_input("관리자 비밀번호", type="password") != admin_password:
+            st.info("관리자만 볼 수 있습니다.")
+        else:
+            st.markdown("### 📈 단계별 처리 시간 (p50 / p95 / p99)")
+            metric_rows = get_metrics().summary()
+            if metric_rows:
+                st.dataframe(metric_rows, use_container_width=True, hide_index=True)
+            else:
+                st.info("아직 수집된 측정값이 없습니다.")
+            st.json({"cache": get_cache().stats(), "prefetch": get_prefetch_pool(api_key).status() if get_prefetch_pool(api_key) else None,
+                     "single_flight": get_single_flight().stats(), "api_tokens_available": get_api_limiter().available(),
+                     "providers": get_router(api_key, MODEL_NAME, GENERATION_CONFIG).status()},
+                    expanded=False)
+            st.markdown("### 📏 유형별 프롬프트 크기 (토큰 예산)")
+            st.dataframe(prompt_size_report(), use_container_width=True, hide_index=True)
+            st.download_button("⬇️ Prometheus 스냅샷", get_metrics().prometheus_text(), file_name="metrics.prom",
+                               mime="text/plain")
+
+            st.divider()
+            st.markdown("### 🏫 학급 분석 (저장된 문제 세트의 채점 기록)")
+            report = analyze(*get_attempt_log().columns())
+            if report["rows"]:
+                st.caption(f"학생 {report['students']}명 · 응시 {report['attempts']}회 · 응답 {report['rows']}개")
+                st.markdown("**유형별 정답률**")
+                st.dataframe(report["types"], use_container_width=True, hide_index=True)
+                st.markdown("**문항 분석** (난이도 = 정답률, 변별도 = 상위 27% 정답률 - 하위 27% 정답률)")
+                st.dataframe(report["items"], use_container_width=True, hide_index=True)
+                col_e1, col_e2 = st.columns(2)
+                col_e1.download_button("⬇️ 유형별 정답률 (CSV)", to_csv(report["types"]), file_name="type_accuracy.csv",
+                                       mime="text/csv")
+                col_e2.download_button("⬇️ 문항 분석 (CSV)", to_csv(report["items"]), file_name="item_analysis.csv",
+                                       mime="text/csv")
+            else:
+                st.info("아직 채점 기록이 없습니다. 문제 세트를 저장한 뒤 채점하면 기록됩니다.")
+
+# --- Render Fragments ---
+# Interacting with the quiz or the vocabulary panel reruns only that fragment,
+# not the whole script (older Streamlit without fragments reruns everything).
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+@fragment
+def render_regenerate(api_key, result):
+    questions = result.get('questions', [])
+
+    # Repair one part without paying for the whole passage again
+    with st.expander("🔧 일부만 다시 만들기 (지문은 그대로 유지)"):
+        regen_targets = ["explanations", "vocabulary"] + [("question", i) for i in range(len(questions))]
+        regen_labels = {"explanations": "해설 전체", "vocabulary": "어휘 목록"}
+        regen_target = st.selectbox(
+            "다시 만들 부분",
+            regen_targets,
+            format_func=lambda t: regen_labels[t] if isinstance(t, str) else f"{questions[t[1]].get('number', t[1]+1)}번 문제",
+        )
+        if st.button("🔄 다시 만들기"):
+            with st.spinner("선택한 부분만 다시 생성하고 있습니다..."):
+                part, index = (regen_target, None) if isinstance(regen_target, str) else regen_target
+                regenerated = regenerate_part(api_key, result, part, index)
+            if "error" in regenerated:
+                st.error(f"오류가 발생했습니다: {regenerated['error']}")
+            else:
+                st.session_state.generated_content = regenerated
+                if part == "question":
+                    # The old choice may not exist among the new options
+                    st.session_state.pop(f"q_{index}", None)
+                    st.session_state.graded = False
+                if st.session_state.history_id is not None:
+                    update_history_entry(st.session_state.history_id, regenerated)
+                st.rerun()
+
+def render_labels():
+    meta = st.session_state.generated_meta
+    return {"question_type": meta.get("question_type"), "grade": f"{meta.get('school_level')} {meta.get('grade')}"}
+
+@fragment
+def render_quiz(result):
+    with span("render_quiz", **render_labels()):
+        render_quiz_body(result)
+
+def render_quiz_body(result):
     questions = result.get('questions', [])
+    sections = {s['question_start']: s for s in result.get('sections', [])}
     user_answers = {}
 
     # Form for submission
     with st.form("quiz_form"):
         for idx, q in enumerate(questions):
+            if idx in sections:
+                section = sections[idx]
+                last_number = section['number'] + section['question_count'] - 1
+                numbers = f"{section['number']}~{last_number}" if last_number > section['number'] else f"{section['number']}"
+                st.markdown(f"#### [{numbers}] {section['title']}")
+                st.markdown(build_passage_html(section['passage']), unsafe_allow_html=True)
+
             # Clean up question text to prevent markdown conflicts
             q_text = q.get('question', '').strip().replace('**', '')
-            st.markdown(f"**{idx+1}.** {q_text}")
+            st.markdown(f"**{q.get('number', idx+1)}.** {q_text}")
             
             # Show Options using Radio Buttons
             options = q.get('options', [])
@@ -394,6 +480,8 @@ if st.session_state.generated_content:
             
             st.write("") # Spacer between questions
         
+        st.text_input("이름 (학급 분석용, 선택)", key="student_name")
+
         # Submit Button
         submitted = st.form_submit_button("💯 채점하기 (Grade Me)")
         if submitted:
@@ -401,89 +489,98 @@ if st.session_state.generated_content:
             if len(user_answers) < len(questions) or any(v is None for v in user_answers.values()):
                 st.warning("⚠️ 모든 문제를 풀어야 채점할 수 있습니다. (답안을 선택하지 않은 문제가 있습니다)")
             else:
+                # The fragment is already rerunning, so the results render below
                 st.session_state.graded = True
-                st.rerun()
+                # Only saved sets have an id that class analytics can group by.
+                # Recorded once per set and answer sheet, however often this reruns.
+                student = st.session_state.get('student_name') or "익명"
+                graded_key = (st.session_state.history_id, student,
+                              tuple(user_answers.get(idx) for idx in range(len(questions))))
+                if st.session_state.history_id is not None and st.session_state.get('recorded_grading') != graded_key:
+                    st.session_state.recorded_grading = graded_key
+                    elapsed = time.time() - st.session_state.get('quiz_started_at', time.time())
+                    right = get_attempt_log().record(student, st.session_state.history_id, questions, user_answers,
+                                                     elapsed)
+                    get_history_store().set_score(st.session_state.history_id, right.mean() * 100)
 
-    # --- Grading Results ---
     if st.session_state.graded:
-        st.divider()
-        st.subheader("📊 채점 결과 (Results)")
-        
-        score = 0
-        total = len(questions)
-        
+        render_results(result, questions, user_answers)
+
+def render_results(result, questions, user_answers):
+    st.divider()
+    st.subheader("📊 채점 결과 (Results)")
+
+    chosen, correct, right = grade_answers(questions, user_answers)
+
+    for idx, q in enumerate(questions):
+        if right[idx]:
+            st.success(f"**{q.get('number', idx+1)}번 정답!** (선택: {chosen[idx]})")
+        else:
+            st.error(f"**{q.get('number', idx+1)}번 오답** (선택: {chosen[idx] if chosen[idx] else '미선택'} / 정답: {correct[idx]})")
+
+    final_score = right.mean() * 100
+    st.markdown(f"### 🏆 당신의 점수는 **{int(final_score)}점** 입니다!")
+
+    # Show Detailed Explanations
+    st.divider()
+    with st.expander("📝 정답 및 상세 해설 보기", expanded=True):
         for idx, q in enumerate(questions):
-            correct_answer_raw = str(q.get('answer')).strip()
-            user_choice = user_answers.get(idx)
-            
-            # Logic to extract number from "3. Option C"
-            user_number = user_choice.split('.')[0].strip() if user_choice else None
-            correct_number = correct_answer_raw.split('.')[0].strip()
-            
-            is_correct = (user_number == correct_number)
-            if is_correct:
-                score += 1
-                st.success(f"**{idx+1}번 정답!** (선택: {user_number})")
-            else:
-                st.error(f"**{idx+1}번 오답** (선택: {user_number if user_number else '미선택'} / 정답: {correct_number})")
-        
-        final_score = (score / total) * 100
-        st.markdown(f"### 🏆 당신의 점수는 **{int(final_score)}점** 입니다!")
+            st.markdown(f"**[{q.get('number', idx+1)}번 문제]**")
+            st.markdown(f"- **정답**: {q.get('answer')}")
+            st.markdown(f"- **유형**: {q.get('type')}")
+            st.markdown(f"- **해설**: {q.get('explanation')}")
+            st.divider()
 
-        # Show Detailed Explanations
-        st.divider()
-        with st.expander("📝 정답 및 상세 해설 보기", expanded=True):
-            for idx, q in enumerate(questions):
-                st.markdown(f"**[{idx+1}번 문제]**")
-                st.markdown(f"- **정답**: {q.get('answer')}")
-                st.markdown(f"- **유형**: {q.get('type')}")
-                st.markdown(f"- **해설**: {q.get('explanation')}")
-                st.divider()
-        
-        # Vocabulary Section with TTS
-        st.divider()
-        with st.expander("📚 주요 어휘 및 숙어 정리 (Vocabulary + 듣기)"):
-            vocab_list = result.get('vocabulary', [])
-            if vocab_list:
-                # Use HTML/JS for client-side TTS (Text-to-Speech)
-                vocab_html = """
-                <style>
-                    .vocab-item { margin-bottom: 8px; font-family: sans-serif; font-size: 16px; display: flex; align-items: center; }
-                    .speak-btn { 
-                        background-color: #f0f2f6; border: 1px solid #dce4ef; border-radius: 4px; 
-                        cursor: pointer; margin-right: 10px; padding: 2px 6px; font-size: 14px;
-                    }
-                    .speak-btn:hover { background-color: #e0e5eb; }
-                </style>
-                <script>
-                    function speak(text) {
-                        if ('speechSynthesis' in window) {
-                            var msg = new SpeechSynthesisUtterance();
-                            msg.text = text;
-                            msg.lang = 'en-US';
-                            window.speechSynthesis.speak(msg);
-                        } else {
-                            alert("이 브라우저는 TTS를 지원하지 않습니다.");
-                        }
-                    }
-                </script>
-                <div style="padding: 10px;">
-                """
-                
-                for v in vocab_list:
-                    word = v.get('word', '').replace("'", "\\'") # Escape quotes
-                    meaning = v.get('meaning', '')
-                    vocab_html += f"""
-                    <div class="vocab-item">
-                        <button class="speak-btn" onclick="speak('{word}')">🔊</button>
-                        <span><b>{word}</b> : {meaning}</span>
-                    </div>
-                    """
-                
-                vocab_html += "</div>"
-                
-                # Render HTML component
-                components.html(vocab_html, height=len(vocab_list) * 40 + 50, scrolling=True)
-                st.caption("🔊 스피커 버튼을 누르면 원어민 발음을 들을 수 있습니다.")
-            else:
-                st.info("정리된 어휘가 없습니다.")
+    # Vocabulary Section with TTS
+    st.divider()
+    render_vocabulary(result.get('vocabulary', []))
+
+@fragment
+def render_vocabulary(vocab_list):
+    with st.expander("📚 주요 어휘 및 숙어 정리 (Vocabulary + 듣기)"):
+        if vocab_list:
+            # Render HTML component
+            components.html(build_vocab_html(vocab_items(vocab_list)), height=len(vocab_list) * 40 + 50, scrolling=True)
+            st.caption("🔊 스피커 버튼을 누르면 원어민 발음을 들을 수 있습니다.")
+        else:
+            st.info("정리된 어휘가 없습니다.")
+
+# --- Display Content ---
+if st.session_state.generated_content:
+    result = st.session_state.generated_content
+    
+    # Save Button (Top Right of Content)
+    col_s1, col_s2 = st.columns([0.8, 0.2])
+    with col_s2:
+        if st.session_state.history_id is not None:
+            st.caption(f"💾 저장됨 (#{st.session_state.history_id})")
+        elif st.button("💾 저장 (Save)"):
+            meta = st.session_state.generated_meta
+            st.session_state.history_id = save_to_history(
+                result, meta.get("topic") or topic or "Untitled",
+                school_level=meta.get("school_level"), grade=meta.get("grade"),
+                question_type=meta.get("question_type"), difficulty=meta.get("difficulty"),
+                namespace=st.session_state.get("namespace", "").strip(),
+            )
+            st.toast(f"저장 완료! (#{st.session_state.history_id})", icon="✅")
+
+    # Display Passage with Box Style
+    st.divider()
+    st.subheader(f"📖 {result.get('title', 'Reading Passage')}")
+    
+    # A full mock exam has one passage per section, shown inside the form
+    sections = {s['question_start']: s for s in result.get('sections', [])}
+    if not sections:
+        with span("render_passage", **render_labels()):
+            st.markdown(build_passage_html(result.get('passage', '')), unsafe_allow_html=True)
+    if result.get('warnings'):
+        with st.expander(f"⚠️ 응답을 자동으로 보정했습니다 ({len(result['warnings'])}건)"):
+            for warning in result['warnings']:
+                st.caption(f"- {warning}")
+    for failed in result.get('failed', []):
+        st.warning(f"{failed['number']}번 ({failed['type']}) 문항은 생성하지 못했습니다: {failed['error']}")
+    
+    st.divider()
+    
+    render_regenerate(api_key, result)
+    render_quiz(result)
@@ -0,0 +1,323 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock file is not enforced
+    fcntl = None
+
+# Compressed append-only archive for problem-set JSON, addressed by history id.
+# Sets are zlib-compressed records in segment files (seg-000001.dat, ...),
+# and index.bin is a memory-mapped array of fixed-width entries where entry
+# N says where set N lives. Loading a set is one index lookup, one pread and
+# one decompress, however big the archive gets. Deletes append a tombstone
+# record and clear the entry; compaction copies the live records out of
+# mostly-dead segments in a background thread, started by delete().
+# Only one process may open an archive at a time (archive.lock), so stop the
+# app before running migrate/import/compact from the command line.
+#
+#   python archive.py stats
+#   python archive.py migrate           # move history.db payloads into the archive
+#   python archive.py import history/   # old history/*.json files
+#   python archive.py export out/       # back to the history/*.json layout
+#   python archive.py compact
+
+HISTORY_ARCHIVE_DIR = os.environ.get('HISTORY_ARCHIVE_DIR')  # unset = keep payloads in history.db
+SEGMENT_MAX_BYTES = int(os.environ.get('ARCHIVE_SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+COMPACT_DEAD_RATIO = float(os.environ.get('ARCHIVE_COMPACT_DEAD_RATIO', '0.5'))
+
+# Index entry: segment number (0 = no set), payload offset, payload length, crc32
+_ENTRY = struct.Struct('<IQII')
+# Segment record header: set id, payload length (0 = tombstone)
+_RECORD = struct.Struct('<QI')
+_INDEX_GROW = 4096  # entries added to index.bin at a time
+_SEGMENT_NAME = re.compile(r'seg-(\d{6})\.dat$')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class HistoryArchive:
+    def __init__(self, directory, segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.RLock()
+        self._compactor = None
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, 'archive.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise ArchiveError(f"{directory} is already open in another process")
+
+        self._segments = {}  # number -> read fd
+        self._live = {}      # number -> bytes of records the index points at
+        for name in os.listdir(directory):
+            match = _SEGMENT_NAME.match(name)
+            if match:
+                self._segments[int(match.group(1))] = os.open(os.path.join(directory, name), os.O_RDONLY)
+                self._live[int(match.group(1))] = 0
+        self._active = max(self._segments, default=0)
+        if not self._active:
+            self._new_segment()
+        self._writer = open(self._segment_path(self._active), 'ab')
+
+        index_path = os.path.join(directory, 'index.bin')
+        rebuild = not os.path.exists(index_path)
+        self._index_file = open(index_path, 'a+b')
+        if os.path.getsize(index_path) == 0:
+            self._index_file.truncate(_INDEX_GROW * _ENTRY.size)
+        self._index = mmap.mmap(self._index_file.fileno(), 0)
+        if rebuild:
+            self.rebuild_index()
+        else:
+            for i in range(self._capacity()):
+                segment, _, length, _ = _ENTRY.unpack_from(self._index, i * _ENTRY.size)
+                if segment:
+                    self._live[segment] += _RECORD.size + length
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"seg-{number:06d}.dat")
+
+    def _new_segment(self):
+        self._active += 1
+        path = self._segment_path(self._active)
+        open(path, 'ab').close()
+        self._segments[self._active] = os.open(path, os.O_RDONLY)
+        self._live[self._active] = 0
+        if getattr(self, '_writer', None):
+            self._writer.close()
+            self._writer = open(path, 'ab')
+
+    # --- Index ---
+    def _capacity(self):
+        return len(self._index) // _ENTRY.size
+
+    def _entry(self, set_id):
+        if set_id < 0 or set_id >= self._capacity():
+            return (0, 0, 0, 0)
+        return _ENTRY.unpack_from(self._index, set_id * _ENTRY.size)
+
+    def _set_entry(self, set_id, segment, offset, length, crc):
+        old_segment, _, old_length, _ = self._entry(set_id)
+        if old_segment:
+            self._live[old_segment] -= _RECORD.size + old_length
+        if segment:
+            self._live[segment] += _RECORD.size + length
+        if set_id >= self._capacity():
+            entries = (set_id // _INDEX_GROW + 1) * _INDEX_GROW
+            self._index.close()
+            self._index_file.truncate(entries * _ENTRY.size)
+            self._index = mmap.mmap(self._index_file.fileno(), 0)
+        _ENTRY.pack_into(self._index, set_id * _ENTRY.size, segment, offset, length, crc)
+
+    def _append(self, set_id, payload):
+        # Returns the offset of the payload in the active segment
+        if self._writer.tell() + _RECORD.size + len(payload) > self.segment_max_bytes and self._writer.tell():
+            self._new_segment()
+        self._writer.write(_RECORD.pack(set_id, len(payload)))
+        offset = self._writer.tell()
+        self._writer.write(payload)
+        self._writer.flush()
+        return offset
+
+    def _records(self, number):
+        # (set id, payload offset, payload length) for each record in a segment
+        fd = self._segments[number]
+        size = os.fstat(fd).st_size
+        position = 0
+        while position + _RECORD.size <= size:
+            set_id, length = _RECORD.unpack(os.pread(fd, _RECORD.size, position))
+            position += _RECORD.size
+            if position + length > size:
+                return  # torn write at the end of the last segment
+            yield set_id, position, length
+            position += length
+
+    def _dead_ratio(self, number):
+        size = os.fstat(self._segments[number]).st_size
+        return 1 - self._live[number] / size if size else 0.0
+
+    # --- Public API ---
+    def put(self, set_id, data):
+        payload = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        with self._lock:
+            offset = self._append(set_id, payload)
+            self._set_entry(set_id, self._active, offset, len(payload), zlib.crc32(payload))
+
+    def get(self, set_id):
+        with self._lock:
+            segment, offset, length, crc = self._entry(set_id)
+            if not segment:
+                raise KeyError(set_id)
+            payload = os.pread(self._segments[segment], length, offset)
+        if zlib.crc32(payload) != crc:
+            raise ArchiveError(f"set {set_id}: checksum mismatch in segment {segment}")
+        return json.loads(zlib.decompress(payload))
+
+    def __contains__(self, set_id):
+        with self._lock:
+            return bool(self._entry(set_id)[0])
+
+    def delete(self, set_id):
+        with self._lock:
+            segment = self._entry(set_id)[0]
+            if not segment:
+                return
+            self._append(set_id, b"")
+            self._set_entry(set_id, 0, 0, 0, 0)
+            if segment != self._active and self._dead_ratio(segment) >= COMPACT_DEAD_RATIO:
+                self.compact_in_background()
+
+    def flush(self):
+        with self._lock:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._index.flush()
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            self.flush()
+            self._writer.close()
+            self._index.close()
+            self._index_file.close()
+            for fd in self._segments.values():
+                os.close(fd)
+            self._segments = {}
+            self._lock_file.close()
+
+    # --- Maintenance ---
+    def rebuild_index(self):
+        # Replays every segment in order; the last record for an id wins
+        with self._lock:
+            self._index[:] = b"\0" * len(self._index)
+            self._live = dict.fromkeys(self._segments, 0)
+            for number in sorted(self._segments):
+                for set_id, position, length in self._records(number):
+                    if length:
+                        payload = os.pread(self._segments[number], length, position)
+                        self._set_entry(set_id, number, position, length, zlib.crc32(payload))
+                    else:
+                        self._set_entry(set_id, 0, 0, 0, 0)
+
+    def stats(self):
+        with self._lock:
+            live = {number: 0 for number in self._segments}
+            count = 0
+            for i in range(self._capacity()):
+                segment, _, length, _ = _ENTRY.unpack_from(self._index, i * _ENTRY.size)
+                if segment:
+                    live[segment] += _RECORD.size + length
+                    count += 1
+            segments = [{"segment": number, "bytes": os.fstat(fd).st_size, "live_bytes": live[number]}
+                        for number, fd in sorted(self._segments.items())]
+        return {"sets": count, "segments": segments,
+                "bytes": sum(s["bytes"] for s in segments), "live_bytes": sum(s["live_bytes"] for s in segments)}
+
+    def compact(self, dead_ratio=COMPACT_DEAD_RATIO):
+        # Rewrites sealed segments that are mostly dead; returns bytes freed
+        freed = 0
+        for segment in self.stats()["segments"]:
+            number = segment["segment"]
+            if number == self._active or not segment["bytes"]:
+                continue
+            if 1 - segment["live_bytes"] / segment["bytes"] < dead_ratio:
+                continue
+            with self._lock:
+                fd = self._segments[number]
+                for set_id in range(self._capacity()):
+                    entry_segment, offset, length, crc = self._entry(set_id)
+                    if entry_segment == number:
+                        new_offset = self._append(set_id, os.pread(fd, length, offset))
+                        self._set_entry(set_id, self._active, new_offset, length, crc)
+                # A tombstone must outlive every older record of its set, or
+                # rebuild_index() would bring the set back
+                deleted = {set_id for set_id, _, length in self._records(number)
+                           if not length and not self._entry(set_id)[0]}
+                if deleted:
+                    older = set()
+                    for older_number in sorted(self._segments):
+                        if older_number < number:
+                            older.update(set_id for set_id, _, length in self._records(older_number) if length)
+                    for set_id in sorted(deleted & older):
+                        self._append(set_id, b"")
+                self.flush()
+                os.close(self._segments.pop(number))
+                del self._live[number]
+                os.remove(self._segment_path(number))
+            freed += segment["bytes"] - segment["live_bytes"]
+        return freed
+
+    def compact_in_background(self, dead_ratio=COMPACT_DEAD_RATIO):
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return self._compactor
+            self._compactor = threading.Thread(target=self.compact, args=(dead_ratio,), daemon=True,
+                                               name='archive-compaction')
+            self._compactor.start()
+            return self._compactor
+
+
+# --- Import / export for the history/*.json layout ---
+def export_json_dir(store, directory):
+    # One "<YYYYmmdd_HHMMSS>_<topic>.json" file per set, as the app used to write
+    os.makedirs(directory, exist_ok=True)
+    exported = 0
+    page = 1
+    while True:
+        rows, total = store.query(page=page, page_size=500)
+        for row in rows:
+            stamp = (row["created_at"] or "").replace("-", "").replace(":", "").replace("T", "_")[:15]
+            topic = re.sub(r'[^\w]+', '_', row["topic"] or "untitled")
+            path = os.path.join(directory, f"{stamp}_{topic}.json")
+            if os.path.exists(path):
+                path = os.path.join(directory, f"{stamp}_{topic}_{row['id']}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(store.get(row["id"]), f, ensure_ascii=False, indent=4)
+            exported += 1
+        if page * 500 >= total:
+            return exported
+        page += 1
+
+
+def main(argv=None):
+    from history_store import HISTORY_DB, HistoryStore
+
+    parser = argparse.ArgumentParser(description="Manage the compressed history archive.")
+    parser.add_argument("command", choices=["stats", "migrate", "import", "export", "compact"])
+    parser.add_argument("path", nargs="?", help="history/*.json directory for import/export")
+    parser.add_argument("--db", default=HISTORY_DB)
+    parser.add_argument("--archive", default=HISTORY_ARCHIVE_DIR or "history_archive")
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db, archive=HistoryArchive(args.archive))
+    if args.command == "stats":
+        print(json.dumps(store.archive.stats(), indent=2))
+    elif args.command == "migrate":
+        print(f"moved {store.migrate_to_archive()} sets into {args.archive}", file=sys.stderr)
+    elif args.command == "import":
+        print(f"imported {store.import_json_dir(args.path or 'history', once=False)} files", file=sys.stderr)
+    elif args.command == "export":
+        if not args.path:
+            parser.error("export needs a target directory")
+        print(f"exported {export_json_dir(store, args.path)} sets to {args.path}", file=sys.stderr)
+    else:
+        print(f"freed {store.archive.compact()} bytes", file=sys.stderr)
+    store.archive.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
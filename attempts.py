@@ -0,0 +1,280 @@
+import csv
+import io
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+# Graded attempts in columnar form plus class-wide analytics.
+# Each column is a raw little-endian array file under ATTEMPTS_DIR that is
+# only ever appended to; strings (student names, question types) are
+# dictionary-encoded in labels.json. Grading and statistics run as single
+# vectorized passes over the columns.
+
+ATTEMPTS_DIR = os.environ.get('ATTEMPTS_DIR', 'attempts')
+
+COLUMNS = {
+    "attempt": np.dtype('<i4'),   # one id per submitted quiz
+    "student": np.dtype('<i4'),   # index into labels["student"]
+    "set_id": np.dtype('<i4'),    # history id of the problem set
+    "question": np.dtype('<i2'),  # question index within the set
+    "qtype": np.dtype('<i2'),     # index into labels["qtype"]
+    "chosen": np.dtype('i1'),     # option number picked, 0 = none
+    "correct": np.dtype('i1'),    # option number of the answer, 0 = unknown
+    "elapsed": np.dtype('<f4'),   # seconds spent per question
+    "ts": np.dtype('<i4'),        # unix time of the submission
+}
+
+# Upper/lower group share for the discrimination index (classic 27% rule)
+GROUP_SHARE = 0.27
+
+_NUMBER = re.compile(r'\s*\(?(\d+)')
+MAX_OPTIONS = 5
+
+
+def answer_number(text):
+    # "3. Option C", "3" and "(3)" all mean option 3; 0 when there is none
+    # (a leading "1990년 ..." is part of the option, not its number)
+    match = _NUMBER.match(str(text)) if text is not None else None
+    number = int(match.group(1)) if match else 0
+    return number if 1 <= number <= MAX_OPTIONS else 0
+
+
+def _label(text):
+    # What the original grader compared: the text before the first "."
+    return str(text).split('.')[0].strip()
+
+
+def option_number(text, options):
+    # Falls back to the option's position for letter or unnumbered options
+    # ("A. happy", "(b) sad"), so they still fit the numeric columns
+    number = answer_number(text)
+    if number or text is None or not options:
+        return number
+    labels = [_label(option) for option in options]
+    if _label(text) in labels:
+        return labels.index(_label(text)) + 1
+    return 0
+
+
+def grade(chosen, correct):
+    # Works for one quiz or a million rows at once
+    chosen = np.asarray(chosen)
+    correct = np.asarray(correct)
+    return (chosen == correct) & (correct > 0)
+
+
+def grade_answers(questions, user_answers):
+    # user_answers: {question index: chosen option text}. Returns
+    # (chosen numbers, correct numbers, boolean mask of right answers)
+    chosen = np.array([option_number(user_answers.get(idx), q.get('options'))
+                       for idx, q in enumerate(questions)], dtype=np.int8)
+    correct = np.array([option_number(q.get('answer'), q.get('options')) for q in questions], dtype=np.int8)
+    right = grade(chosen, correct)
+    for idx in np.flatnonzero(correct == 0):
+        # No option number at all: compare labels as the original grader did
+        choice = user_answers.get(int(idx))
+        right[idx] = choice is not None and _label(choice) == _label(questions[idx].get('answer'))
+    return chosen, correct, right
+
+
+class AttemptLog:
+    def __init__(self, directory=ATTEMPTS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._labels = None
+        self._lookup = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_labels(self):
+        if self._labels is None:
+            path = self._path('labels.json')
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._labels = json.load(f)
+            else:
+                self._labels = {"student": [], "qtype": []}
+            self._lookup = {kind: {name: i for i, name in enumerate(names)} for kind, names in self._labels.items()}
+        return self._labels
+
+    def _code(self, kind, name):
+        name = name or ""
+        code = self._lookup[kind].get(name)
+        if code is None:
+            code = len(self._labels[kind])
+            self._labels[kind].append(name)
+            self._lookup[kind][name] = code
+        return code
+
+    def _save_labels(self):
+        path = self._path('labels.json')
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._labels, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_columns(self):
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            path = self._path(f"{name}.col")
+            columns[name] = np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.empty(0, dtype=dtype)
+        # A crash between column appends leaves some columns one row longer
+        rows = min(len(c) for c in columns.values())
+        return {name: c[:rows] for name, c in columns.items()}
+
+    # --- Writes ---
+    def record(self, student, set_id, questions, user_answers, elapsed=None):
+        # Grades one submitted quiz and appends a row per question.
+        # Returns the boolean mask of right answers.
+        chosen, correct, right = grade_answers(questions, user_answers)
+        n = len(questions)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            lock_file = open(self._path('lock'), 'a')
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._append(n, student, set_id, questions, chosen, correct, elapsed)
+            finally:
+                lock_file.close()
+        return right
+
+    def _append(self, n, student, set_id, questions, chosen, correct, elapsed):
+        # Other server processes may have appended since we last looked, so
+        # labels and the last attempt id are re-read under the file lock
+        self._labels = None
+        self._load_labels()
+        rows = {
+            "attempt": np.full(n, self._last_attempt() + 1),
+            "student": np.full(n, self._code("student", student)),
+            "set_id": np.full(n, set_id),
+            "question": np.arange(n),
+            "qtype": np.array([self._code("qtype", q.get('type')) for q in questions]),
+            "chosen": chosen,
+            "correct": correct,
+            "elapsed": np.full(n, (elapsed or 0.0) / max(n, 1)),
+            "ts": np.full(n, int(time.time())),
+        }
+        self._save_labels()
+        for name, dtype in COLUMNS.items():
+            with open(self._path(f"{name}.col"), 'ab') as f:
+                f.write(rows[name].astype(dtype).tobytes())
+
+    def _last_attempt(self):
+        path = self._path("attempt.col")
+        itemsize = COLUMNS["attempt"].itemsize
+        if not os.path.exists(path) or os.path.getsize(path) < itemsize:
+            return -1
+        with open(path, 'rb') as f:
+            f.seek((os.path.getsize(path) // itemsize - 1) * itemsize)
+            return int(np.frombuffer(f.read(itemsize), dtype=COLUMNS["attempt"])[0])
+
+    # --- Reads ---
+    def columns(self):
+        with self._lock:
+            self._load_labels()
+            columns = self._read_columns()
+            labels = {kind: list(names) for kind, names in self._labels.items()}
+        return columns, labels
+
+    def __len__(self):
+        path = self._path("attempt.col")
+        return os.path.getsize(path) // COLUMNS["attempt"].itemsize if os.path.exists(path) else 0
+
+
+def analyze(columns, labels):
+    # One vectorized pass: accuracy per question type, and per item (a
+    # question of a set) its difficulty (share answered right) and
+    # discrimination (upper-group minus lower-group share right, groups
+    # being the top/bottom 27% of attempts at the same set by score).
+    right = grade(columns["chosen"], columns["correct"]).astype(np.float64)
+    n = len(right)
+    if n == 0:
+        return {"rows": 0, "attempts": 0, "students": 0, "types": [], "items": []}
+
+    qtype = columns["qtype"].astype(np.int64)
+    type_count = np.bincount(qtype)
+    type_right = np.bincount(qtype, weights=right)
+    type_elapsed = np.bincount(qtype, weights=columns["elapsed"])
+    types = [
+        {"question_type": labels["qtype"][code], "answers": int(type_count[code]),
+         "accuracy": round(float(type_right[code] / type_count[code]), 3),
+         "avg_seconds": round(float(type_elapsed[code] / type_count[code]), 1)}
+        for code in np.flatnonzero(type_count)
+    ]
+
+    # Score of every attempt, broadcast back to its rows
+    attempt_ids, attempt_inv = np.unique(columns["attempt"], return_inverse=True)
+    attempt_score = np.bincount(attempt_inv, weights=right) / np.bincount(attempt_inv)
+    attempt_set = np.zeros(len(attempt_ids), dtype=np.int64)
+    attempt_set[attempt_inv] = columns["set_id"]
+
+    # Rank attempts by score within their set: 0 = worst, 1 = best
+    order = np.lexsort((attempt_score, attempt_set))
+    sorted_sets = attempt_set[order]
+    starts = np.flatnonzero(np.r_[True, sorted_sets[1:] != sorted_sets[:-1]])
+    sizes = np.diff(np.r_[starts, len(order)])
+    group_start = np.repeat(starts, sizes)
+    group_size = np.repeat(sizes, sizes)
+    rank = np.empty(len(order))
+    rank[order] = (np.arange(len(order)) - group_start) / np.maximum(group_size - 1, 1)
+    # A set with a single attempt has no upper or lower group
+    grouped = np.empty(len(order), dtype=bool)
+    grouped[order] = group_size > 1
+    upper = (grouped & (rank >= 1 - GROUP_SHARE))[attempt_inv]
+    lower = (grouped & (rank <= GROUP_SHARE))[attempt_inv]
+
+    item_key = columns["set_id"].astype(np.int64) << 16 | columns["question"].astype(np.int64)
+    item_ids, item_inv = np.unique(item_key, return_inverse=True)
+    item_count = np.bincount(item_inv)
+    item_right = np.bincount(item_inv, weights=right)
+    upper_count = np.bincount(item_inv, weights=upper)
+    lower_count = np.bincount(item_inv, weights=lower)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        difficulty = item_right / item_count
+        discrimination = (np.bincount(item_inv, weights=right * upper) / upper_count
+                          - np.bincount(item_inv, weights=right * lower) / lower_count)
+    item_type = np.zeros(len(item_ids), dtype=np.int64)
+    item_type[item_inv] = qtype
+
+    items = [
+        {"set_id": int(item_ids[i] >> 16), "question": int(item_ids[i] & 0xFFFF) + 1,
+         "question_type": labels["qtype"][item_type[i]], "answers": int(item_count[i]),
+         "difficulty": round(float(difficulty[i]), 3),
+         "discrimination": None if np.isnan(discrimination[i]) else round(float(discrimination[i]), 3)}
+        for i in range(len(item_ids))
+    ]
+    return {"rows": n, "attempts": len(attempt_ids), "students": int(len(np.unique(columns["student"]))),
+            "types": types, "items": items}
+
+
+def to_csv(rows):
+    if not rows:
+        return ""
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+    return out.getvalue()
+
+
+_default_log = None
+_default_lock = threading.Lock()
+
+
+def get_attempt_log():
+    global _default_log
+    with _default_lock:
+        if _default_log is None:
+            _default_log = AttemptLog()
+        return _default_log
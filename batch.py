@@ -0,0 +1,168 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from exam import FULL_EXAM_TYPE, assemble_full_exam
+from generator import TOPICS, generate_problem_set, normalize_topic, save_to_history
+from ratelimit import RateLimiter
+
+# Headless bulk generation (no Streamlit import):
+#   python batch.py specs.csv --out semester.jsonl
+#   python batch.py specs.jsonl --history --workers 4 --per-minute 20
+# Each spec has school_level, grade, topic, difficulty (or difficulty_level)
+# and question_type. Finished specs are appended to a checkpoint file, so an
+# interrupted run picks up where it stopped when started again.
+
+SPEC_FIELDS = ("school_level", "grade", "topic", "difficulty", "question_type")
+
+
+def read_specs(path):
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.endswith('.jsonl'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    specs = []
+    for line_no, row in enumerate(rows, start=1):
+        spec = {field: (row.get(field) or "").strip() for field in SPEC_FIELDS}
+        if not spec["difficulty"]:
+            spec["difficulty"] = (row.get("difficulty_level") or "중 (Medium)").strip()
+        missing = [field for field in ("school_level", "grade", "question_type") if not spec[field]]
+        if missing:
+            raise ValueError(f"{path}:{line_no}: missing {', '.join(missing)}")
+        specs.append((spec_id(line_no, spec), spec))
+    return specs
+
+
+def spec_id(line_no, spec):
+    # The line number keeps deliberately repeated specs apart
+    canonical = json.dumps({k: normalize_topic(v) for k, v in spec.items()}, ensure_ascii=False, sort_keys=True)
+    return f"{line_no}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]}"
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def run_spec(api_key, spec, limiter, index, use_cache=True, namespace=""):
+    # A spec without a topic takes the recommended topics in turn
+    topic = spec["topic"] or TOPICS[index % len(TOPICS)]
+    if spec["question_type"] == FULL_EXAM_TYPE:
+        topics = [spec["topic"]] if spec["topic"] else TOPICS
+        return topic, assemble_full_exam(generate_problem_set, api_key, spec["school_level"], spec["grade"],
+                                         topics, spec["difficulty"])
+    limiter.acquire()
+    return topic, generate_problem_set(api_key, spec["school_level"], spec["grade"], topic,
+                                       spec["difficulty"], spec["question_type"], use_cache=use_cache,
+                                       namespace=namespace)
+
+
+def run_batch(api_key, specs, out_path=None, to_history=False, checkpoint_path=None, workers=4,
+              per_minute=30, use_cache=True, namespace="", log=print):
+    done_ids = load_checkpoint(checkpoint_path) if checkpoint_path else set()
+    pending = [(i, sid, spec) for i, (sid, spec) in enumerate(specs) if sid not in done_ids]
+    log(f"{len(specs)} specs, {len(specs) - len(pending)} already done, {len(pending)} to go")
+
+    limiter = RateLimiter(per_minute, burst=workers)
+    write_lock = threading.Lock()
+    out_file = open(out_path, 'a', encoding='utf-8') if out_path else None
+    checkpoint_file = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+    counts = {"ok": 0, "failed": 0}
+    started = time.monotonic()
+
+    def record(sid, spec, topic, result):
+        with write_lock:
+            if "error" in result:
+                counts["failed"] += 1
+                log(f"[failed] {sid} {spec['question_type']} / {topic}: {result['error'].splitlines()[0]}")
+                return
+            entry = {"id": sid, "spec": {**spec, "topic": topic}, "result": result}
+            if to_history:
+                entry["history_id"] = save_to_history(result, topic, school_level=spec["school_level"],
+                                                      grade=spec["grade"], question_type=spec["question_type"],
+                                                      difficulty=spec["difficulty"], namespace=namespace)
+            if out_file:
+                out_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                out_file.flush()
+            if checkpoint_file:
+                checkpoint_file.write(sid + "\n")
+                checkpoint_file.flush()
+            counts["ok"] += 1
+            log(f"[{counts['ok'] + counts['failed']}/{len(pending)}] {sid} {spec['question_type']} / {topic}")
+
+    try:
+        # Keep at most 2x workers specs in flight so huge spec files are not
+        # all queued up front
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as executor:
+            in_flight = {}
+            queue = iter(pending)
+            while True:
+                while len(in_flight) < workers * 2:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    index, sid, spec = item
+                    in_flight[executor.submit(run_spec, api_key, spec, limiter, index, use_cache, namespace)] = (sid, spec)
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    sid, spec = in_flight.pop(future)
+                    try:
+                        topic, result = future.result()
+                    except Exception as e:
+                        topic, result = spec["topic"], {"error": str(e)}
+                    record(sid, spec, topic, result)
+    finally:
+        if out_file:
+            out_file.close()
+        if checkpoint_file:
+            checkpoint_file.close()
+
+    log(f"done: {counts['ok']} ok, {counts['failed']} failed in {time.monotonic() - started:.1f}s")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate problem sets in bulk without the Streamlit UI.")
+    parser.add_argument("specs", help="CSV or JSONL file of specs")
+    parser.add_argument("--out", help="append results to this JSONL file")
+    parser.add_argument("--history", action="store_true", help="also save every result to the history store")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <specs>.done)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--per-minute", type=int, default=30, help="API request budget per minute")
+    parser.add_argument("--no-cache", action="store_true", help="always call the model")
+    parser.add_argument("--namespace", default="", help="history namespace to save into (default: shared)")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"))
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("set GEMINI_API_KEY or pass --api-key")
+    if not args.out and not args.history:
+        parser.error("nothing to write: pass --out and/or --history")
+
+    try:
+        specs = read_specs(args.specs)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    counts = run_batch(args.api_key, specs, out_path=args.out, to_history=args.history,
+                       checkpoint_path=args.checkpoint or args.specs + ".done", workers=args.workers,
+                       per_minute=args.per_minute, use_cache=not args.no_cache, namespace=args.namespace,
+                       log=lambda message: print(message, file=sys.stderr))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_gemini
+
+# Offline benchmarks against the fake Gemini in fake_gemini.py (no network,
+# no API quota). Results are written as JSON so two versions can be compared:
+#   python benchmark.py --out before.json
+#   python benchmark.py --out after.json --compare before.json
+
+HISTORY_SIZES = (10, 1000, 100000)
+QUESTION_TYPE_SAMPLE = ("종합 (General Practice) - 5문제", "31-34번: 빈칸추론 (Killer) (1문제)",
+                        "41-42번: 장문 독해 (2문제)", "43-45번: 복합 장문 (3문제)")
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.fmean(ms),
+        "p50_ms": ms[len(ms) // 2],
+        "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+        "min_ms": ms[0],
+        "max_ms": ms[-1],
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def _git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class Bench:
+    def __init__(self, workdir, repeat, latency):
+        self.workdir = workdir
+        self.repeat = repeat
+        self.latency = latency
+        self.results = {}
+
+        fake_gemini.install(fake_gemini.FakeBehavior(latency=latency))
+        # Everything the app would write to the working directory goes to
+        # workdir; set before the modules below read their settings
+        os.environ.update(HISTORY_DB=os.path.join(workdir, "history.db"),
+                          METRICS_FILE=os.path.join(workdir, "metrics", "metrics.jsonl"),
+                          ATTEMPTS_DIR=os.path.join(workdir, "attempts"),
+                          PROBLEM_CACHE_DIR=os.path.join(workdir, "cache"))
+        os.environ.pop("HISTORY_ARCHIVE_DIR", None)
+        # Imported after install() so nothing touches the real package
+        import cache
+        import generator
+        import history_store
+        import ratelimit
+        import render
+        self.cache = cache
+        self.generator = generator
+        self.history_store = history_store
+        self.render = render
+        cache._default_cache = cache.ProblemSetCache(directory=os.path.join(workdir, "cache"))
+        # Preset so the legacy history/ import in get_history_store() never runs
+        self.store = history_store.HistoryStore(os.path.join(workdir, "history.db"))
+        history_store._default_store = self.store
+        # The fake backend has no quota; a real limiter would time the bucket, not the code
+        ratelimit.set_api_limiter(ratelimit.RateLimiter(10 ** 9))
+
+    def record(self, name, summary, **extra):
+        summary.update(extra)
+        self.results[name] = summary
+        print(f"{name:55s} p50 {summary['p50_ms']:9.3f} ms   p95 {summary['p95_ms']:9.3f} ms", file=sys.stderr)
+
+    # --- Generation ---
+    def prompt_build(self):
+        g = self.generator
+        for question_type in QUESTION_TYPE_SAMPLE:
+            self.record(f"prompt_build[{question_type}]",
+                        timed(lambda: g.build_prompt("고등학교", "3학년", "AI & Ethics", "상 (Hard)", question_type),
+                              self.repeat * 10))
+
+    def parse(self):
+        g = self.generator
+        clean = json.dumps(fake_gemini.make_problem_set(3, 550), ensure_ascii=False, indent=2)
+        self.record("parse[clean]", timed(lambda: g.parse_model_json(clean), self.repeat * 10))
+        rng = random.Random(1)
+        for kind in range(3):
+            broken = fake_gemini._malform(clean, rng)
+            self.record(f"parse[malformed-{kind}]", timed(lambda: g.parse_model_json(broken), self.repeat * 10))
+
+    def generate(self):
+        g = self.generator
+        for question_type in QUESTION_TYPE_SAMPLE:
+            self.record(f"generate[miss,{question_type}]",
+                        timed(lambda: g.generate_problem_set("k", "고등학교", "3학년", "AI", "중 (Medium)",
+                                                             question_type, use_cache=False), self.repeat))
+        g.generate_problem_set("k", "고등학교", "3학년", "AI", "중 (Medium)", QUESTION_TYPE_SAMPLE[0])
+        self.record("generate[cache-hit]",
+                    timed(lambda: g.generate_problem_set("k", "고등학교", "3학년", "AI", "중 (Medium)",
+                                                         QUESTION_TYPE_SAMPLE[0]), self.repeat * 10))
+
+    def stream(self):
+        g = self.generator
+        fake_gemini.install(fake_gemini.FakeBehavior(latency=self.latency, chunk_size=64, chunk_delay=self.latency / 50))
+        first, total = [], []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            got_first = False
+            for event in g.generate_problem_set_stream("k", "고등학교", "3학년", "AI", "중 (Medium)",
+                                                       "43-45번: 복합 장문 (3문제)", use_cache=False):
+                if not got_first and event[0] == "field" and event[1] == "passage":
+                    first.append(time.perf_counter() - started)
+                    got_first = True
+            total.append(time.perf_counter() - started)
+        self.record("stream[time-to-passage]", summarize(first))
+        self.record("stream[total]", summarize(total))
+        fake_gemini.install(fake_gemini.FakeBehavior(latency=self.latency))
+
+    def errors(self):
+        g = self.generator
+        fake_gemini.install(fake_gemini.FakeBehavior(latency=self.latency, rate_limit_rate=1.0))
+        self.record("generate[rate-limited]",
+                    timed(lambda: g.generate_problem_set("k", "고등학교", "1학년", "AI", "중 (Medium)",
+                                                         QUESTION_TYPE_SAMPLE[1], use_cache=False), self.repeat))
+        fake_gemini.install(fake_gemini.FakeBehavior(latency=self.latency, malformed_rate=1.0))
+        self.record("generate[malformed]",
+                    timed(lambda: g.generate_problem_set("k", "고등학교", "1학년", "AI", "중 (Medium)",
+                                                         QUESTION_TYPE_SAMPLE[1], use_cache=False), self.repeat))
+
+        # 404 on the configured model: first call pays for discovery and fallback
+        import gemini_client
+        fake_gemini.install(fake_gemini.FakeBehavior(latency=self.latency, missing_models={g.MODEL_NAME}))
+        gemini_client._clients.clear()
+        gemini_client._directories.clear()
+        self.record("generate[404-fallback]",
+                    timed(lambda: g.generate_problem_set("k404", "고등학교", "1학년", "AI", "중 (Medium)",
+                                                         QUESTION_TYPE_SAMPLE[1], use_cache=False), self.repeat))
+        gemini_client._clients.clear()
+        gemini_client._directories.clear()
+        fake_gemini.install(fake_gemini.FakeBehavior(latency=self.latency))
+
+    # --- History ---
+    def history(self, sizes):
+        g = self.generator
+        sample = fake_gemini.make_problem_set(5, 300)
+        for size in sizes:
+            store = self.history_store.HistoryStore(os.path.join(self.workdir, f"history-{size}.db"))
+            self.history_store._default_store = store
+            started = time.perf_counter()
+            ids = [store.save(sample, f"topic {i % 10}", "고등학교", f"{i % 3 + 1}학년", QUESTION_TYPE_SAMPLE[i % 4],
+                              "중 (Medium)") for i in range(size)]
+            populate = time.perf_counter() - started
+            rng = random.Random(size)
+
+            self.record(f"history.save_to_history[{size}]",
+                        timed(lambda: g.save_to_history(sample, "bench", school_level="중학교", grade="1학년"), self.repeat),
+                        populate_s=populate)
+            self.record(f"history.load_from_history[{size}]",
+                        timed(lambda: g.load_from_history(rng.choice(ids)), self.repeat * 10))
+            self.record(f"history.get_history_files[{size}]",
+                        timed(lambda: g.get_history_files(page=1), self.repeat * 10))
+            self.record(f"history.get_history_files[{size},filtered]",
+                        timed(lambda: g.get_history_files(page=2, grade="2학년", question_type=QUESTION_TYPE_SAMPLE[1]),
+                              self.repeat * 10))
+            self.record(f"history.get_history_files[{size},search]",
+                        timed(lambda: g.get_history_files(page=1, search="climate"), self.repeat * 10))
+            self.history_store._default_store = self.store
+
+    # --- Rendering ---
+    def rendering(self):
+        r = self.render
+        data = fake_gemini.make_problem_set(3, 550, vocab_count=10)
+        items = r.vocab_items(data["vocabulary"])
+
+        def cold_passage():
+            r.build_passage_html.cache_clear()
+            r.build_passage_html(data["passage"])
+
+        def cold_vocab():
+            r.build_vocab_html.cache_clear()
+            r.build_vocab_html(items)
+
+        self.record("render.passage[cold]", timed(cold_passage, self.repeat * 10))
+        self.record("render.passage[memoized]", timed(lambda: r.build_passage_html(data["passage"]), self.repeat * 10))
+        self.record("render.vocabulary[cold]", timed(cold_vocab, self.repeat * 10))
+        self.record("render.vocabulary[memoized]",
+                    timed(lambda: r.build_vocab_html(r.vocab_items(data["vocabulary"])), self.repeat * 10))
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)["results"]
+    print(f"\n{'benchmark':55s} {'before':>10s} {'after':>10s} {'change':>8s}", file=sys.stderr)
+    for name, result in current.items():
+        if name in baseline and baseline[name]["p50_ms"] > 0:
+            before, after = baseline[name]["p50_ms"], result["p50_ms"]
+            print(f"{name:55s} {before:10.3f} {after:10.3f} {(after / before - 1) * 100:+7.1f}%", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a fake Gemini backend.")
+    parser.add_argument("--out", default="bench_output.json")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency in seconds")
+    parser.add_argument("--history-sizes", default=",".join(str(s) for s in HISTORY_SIZES))
+    parser.add_argument("--only", help="comma-separated groups: prompt,parse,generate,stream,errors,history,render")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args(argv)
+
+    groups = set(args.only.split(",")) if args.only else {"prompt", "parse", "generate", "stream", "errors", "history", "render"}
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        bench = Bench(workdir, args.repeat, args.latency)
+        if "prompt" in groups:
+            bench.prompt_build()
+        if "parse" in groups:
+            bench.parse()
+        if "generate" in groups:
+            bench.generate()
+        if "stream" in groups:
+            bench.stream()
+        if "errors" in groups:
+            bench.errors()
+        if "history" in groups:
+            bench.history([int(s) for s in args.history_sizes.split(",") if s])
+        if "render" in groups:
+            bench.rendering()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "version": _git_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"repeat": args.repeat, "latency": args.latency},
+        "results": bench.results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"wrote {args.out}", file=sys.stderr)
+    if args.compare:
+        compare(bench.results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
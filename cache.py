@@ -0,0 +1,193 @@
+import copy
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+# Two-tier cache for generated problem sets.
+# Tier 1 is an in-process LRU. It lives in this module (not in app.py) so it
+# survives Streamlit reruns, which re-execute the script but not its imports.
+# Tier 2 is a directory of JSON files with a TTL and a total size limit.
+
+CACHE_DIR = os.environ.get('PROBLEM_CACHE_DIR', 'cache')
+CACHE_MEMORY_SIZE = int(os.environ.get('PROBLEM_CACHE_MEMORY_SIZE', '128'))
+CACHE_TTL_SECONDS = int(os.environ.get('PROBLEM_CACHE_TTL', str(7 * 24 * 3600)))
+CACHE_MAX_DISK_BYTES = int(os.environ.get('PROBLEM_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+# How many distinct variants to keep per key. 1 = classic cache (the first
+# answer is served to everyone). With N > 1 a lookup is served one of the k
+# stored variants with probability k/N and otherwise goes to the model, so
+# early lookups already get instant answers and the pool still fills up.
+CACHE_VARIANTS = int(os.environ.get('PROBLEM_CACHE_VARIANTS', '1'))
+
+
+def canonicalize_prompt(prompt):
+    # Indentation inside the f-string prompt is not meaningful to the model
+    lines = [line.strip() for line in prompt.strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def make_cache_key(model_name, prompt):
+    payload = json.dumps(
+        {"model": model_name, "prompt": canonicalize_prompt(prompt)},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _content_hash(data):
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ProblemSetCache:
+    def __init__(self, directory=CACHE_DIR, memory_size=CACHE_MEMORY_SIZE, ttl=CACHE_TTL_SECONDS,
+                 max_disk_bytes=CACHE_MAX_DISK_BYTES, variants=CACHE_VARIANTS):
+        self.directory = directory
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.variants = max(1, variants)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    # --- Public API ---
+    def get(self, key, count_miss=True):
+        # count_miss=False for a re-check right after a counted miss
+        with self._lock:
+            entry = self._memory.get(key)
+            tier = "memory_hits"
+            if entry is not None:
+                self._memory.move_to_end(key)
+            else:
+                entry = self._read_disk(key)
+                tier = "disk_hits"
+                if entry is not None:
+                    self._remember(key, entry)
+
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._drop(key)
+                if count_miss:
+                    self._stats["misses"] += 1
+                return None
+
+            # Opt-in variant policy: see CACHE_VARIANTS
+            if len(entry["variants"]) < self.variants and random.random() >= len(entry["variants"]) / self.variants:
+                if count_miss:
+                    self._stats["misses"] += 1
+                return None
+
+            index = entry.get("served", 0) % len(entry["variants"])
+            entry["served"] = entry.get("served", 0) + 1
+            self._stats[tier] += 1
+            return copy.deepcopy(entry["variants"][index])
+
+    def put(self, key, data):
+        with self._lock:
+            entry = self._memory.get(key) or self._read_disk(key)
+            if entry is None or self._expired(entry):
+                entry = {"created_at": time.time(), "served": 0, "variants": []}
+
+            digest = _content_hash(data)
+            if digest not in [_content_hash(v) for v in entry["variants"]]:
+                entry["variants"].append(copy.deepcopy(data))
+                del entry["variants"][:-self.variants]
+
+            self._remember(key, entry)
+            self._write_disk(key, entry)
+            self._stats["stores"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if os.path.exists(self.directory):
+                for name in os.listdir(self.directory):
+                    if name.endswith('.json'):
+                        os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["memory_entries"] = len(self._memory)
+            return stats
+
+    # --- Internals (caller holds the lock) ---
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _expired(self, entry):
+        return self.ttl > 0 and time.time() - entry["created_at"] > self.ttl
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _drop(self, key):
+        self._memory.pop(key, None)
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        # Unique per writer, so concurrent stores of one key never share a temp file
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(key))
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        total = 0
+        now = time.time()
+        for item in os.scandir(self.directory):
+            if not item.name.endswith('.json'):
+                continue
+            info = item.stat()
+            if self.ttl > 0 and now - info.st_mtime > self.ttl:
+                os.remove(item.path)
+                self._stats["evictions"] += 1
+                continue
+            files.append((info.st_mtime, info.st_size, item.path))
+            total += info.st_size
+
+        files.sort()  # Oldest first
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self._stats["evictions"] += 1
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ProblemSetCache()
+        return _default_cache
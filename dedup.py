@@ -0,0 +1,155 @@
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from history_store import get_history_store, passage_text
+
+# Near-duplicate passage detection with MinHash over word shingles and
+# LSH banding. Sketches of saved sets are persisted in the history store
+# and loaded once; passages generated but not saved are kept in memory
+# only (the most recent DEDUP_RECENT of them). Passages only match within
+# one history namespace.
+#
+# The check needs the generated passage, so both policies cost API calls on
+# a hit: "serve" discards the paid generation and loads the saved set, and
+# "avoid" pays for a second generation (streams stop at the passage, so
+# there only the passage is wasted). Hence off by default.
+
+DEDUP_POLICY = os.environ.get('DEDUP_POLICY', 'off')  # off | serve | avoid
+DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', '0.8'))
+DEDUP_RECENT = int(os.environ.get('DEDUP_RECENT', '500'))
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+BANDS = 16  # 8 rows per band: candidates from a Jaccard of about 0.7 up
+ROWS = NUM_PERM // BANDS
+
+_rng = np.random.RandomState(20240601)  # fixed, so persisted sketches stay comparable
+_A = _rng.randint(1, 2 ** 62, NUM_PERM, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+_B = _rng.randint(0, 2 ** 62, NUM_PERM, dtype=np.int64).astype(np.uint64)
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def shingles(text):
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text):
+    # Multiply-shift hashing of the crc32 of each shingle, NUM_PERM times
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles(text)), dtype=np.uint64)
+    if not len(hashes):
+        return None
+    return ((np.outer(hashes, _A) + _B) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+def similarity(a, b):
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+class SketchIndex:
+    def __init__(self, threshold=DEDUP_THRESHOLD, recent=DEDUP_RECENT):
+        self.threshold = threshold
+        self.recent = recent
+        self._lock = threading.Lock()
+        self._signatures = {}   # key -> signature
+        self._titles = {}       # key -> title, for "avoid these" hints
+        self._namespaces = {}   # key -> history namespace
+        self._bands = [{} for _ in range(BANDS)]  # band bytes -> keys
+        self._unsaved = OrderedDict()  # generated, not saved: "gen:<n>" keys
+        self._next_unsaved = 0
+
+    def _insert(self, key, sig, title, namespace):
+        self._remove(key)
+        self._signatures[key] = sig
+        self._titles[key] = title
+        self._namespaces[key] = namespace
+        for band, bucket in enumerate(self._bands):
+            bucket.setdefault(sig[band * ROWS:(band + 1) * ROWS].tobytes(), []).append(key)
+
+    def _remove(self, key):
+        sig = self._signatures.pop(key, None)
+        if sig is None:
+            return
+        self._titles.pop(key, None)
+        self._namespaces.pop(key, None)
+        for band, bucket in enumerate(self._bands):
+            band_key = sig[band * ROWS:(band + 1) * ROWS].tobytes()
+            keys = bucket.get(band_key)
+            if keys is not None:
+                keys.remove(key)
+                if not keys:
+                    del bucket[band_key]
+
+    # --- Updates ---
+    def add_saved(self, set_id, sig, title="", namespace=""):
+        with self._lock:
+            self._insert(set_id, sig, title, namespace)
+
+    def add_unsaved(self, sig, title="", namespace=""):
+        with self._lock:
+            key = f"gen:{self._next_unsaved}"
+            self._next_unsaved += 1
+            self._insert(key, sig, title, namespace)
+            self._unsaved[key] = True
+            while len(self._unsaved) > self.recent:
+                self._remove(self._unsaved.popitem(last=False)[0])
+
+    def remove(self, set_id):
+        with self._lock:
+            self._remove(set_id)
+
+    # --- Lookups ---
+    def similar(self, sig, threshold=None, limit=5, namespace=""):
+        # [(key, estimated Jaccard, title)] in `namespace`, most similar first
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            candidates = set()
+            for band, bucket in enumerate(self._bands):
+                candidates.update(bucket.get(sig[band * ROWS:(band + 1) * ROWS].tobytes(), ()))
+            matches = []
+            for key in candidates:
+                if self._namespaces[key] != namespace:
+                    continue
+                score = similarity(sig, self._signatures[key])
+                if score >= threshold:
+                    matches.append((key, score, self._titles.get(key, "")))
+        matches.sort(key=lambda m: -m[1])
+        return matches[:limit]
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+def avoid_hint(matches):
+    titles = "\n".join(f'- "{title}"' for _, _, title in matches if title)
+    return ("\n**Originality**: Earlier passages on this topic came out nearly identical. Write a clearly different "
+            "passage (different angle, examples and title) from these:\n" + (titles or "- (untitled)"))
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_sketch_index():
+    # Sets saved before sketches existed are sketched on first use
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            store = get_history_store()
+            index = SketchIndex()
+            for set_id, blob, title, namespace in store.sketches():
+                index.add_saved(set_id, np.frombuffer(blob, dtype=np.uint32), title, namespace)
+            for set_id, title, namespace, data in store.unsketched():
+                sig = signature(passage_text(data))
+                if sig is not None:
+                    store.put_sketch(set_id, sig.tobytes())
+                    index.add_saved(set_id, sig, title, namespace)
+            _default_index = index
+        return _default_index
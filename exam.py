@@ -0,0 +1,146 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ratelimit import RateLimiter
+
+# Full mock exam (Q18-Q45) assembled from concurrent single-type generations.
+
+EXAM_MAX_WORKERS = int(os.environ.get('EXAM_MAX_WORKERS', '6'))
+EXAM_PER_MINUTE = int(os.environ.get('EXAM_PER_MINUTE', '30'))
+EXAM_MAX_RETRIES = int(os.environ.get('EXAM_MAX_RETRIES', '3'))
+EXAM_BACKOFF_SECONDS = float(os.environ.get('EXAM_BACKOFF_SECONDS', '2'))
+
+FULL_EXAM_TYPE = "🧾 실전 모의고사 전체 (18~45번, 28문제)"
+
+# (first question number, question type passed to generate_problem_set)
+FULL_EXAM_PLAN = [
+    (18, "18번: 글의 목적 (1문제)"),
+    (19, "19번: 심경 변화 (1문제)"),
+    (20, "20번: 필자의 주장 (1문제)"),
+    (21, "21번: 함축의미 추론 (1문제)"),
+    (22, "22번: 글의 요지 (1문제)"),
+    (23, "23번: 글의 주제 (1문제)"),
+    (24, "24번: 글의 제목 (1문제)"),
+    (25, "25번: 도표 내용 불일치 (표의 수치를 지문에 글로 제시) (1문제)"),
+    (26, "26번: 인물 내용 불일치 (1문제)"),
+    (27, "27번: 안내문 내용 불일치 (1문제)"),
+    (28, "28번: 안내문 내용 일치 (1문제)"),
+    (29, "29번: 어법 (Grammar) (1문제)"),
+    (30, "30번: 어휘 (Vocabulary) (1문제)"),
+    (31, "31-34번: 빈칸추론 (Killer) (1문제)"),
+    (32, "31-34번: 빈칸추론 (Killer) (1문제)"),
+    (33, "31-34번: 빈칸추론 (Killer) (1문제)"),
+    (34, "31-34번: 빈칸추론 (Killer) (1문제)"),
+    (35, "35번: 흐름과 관계없는 문장 (1문제)"),
+    (36, "36-37번: 글의 순서 (1문제)"),
+    (37, "36-37번: 글의 순서 (1문제)"),
+    (38, "38-39번: 문장 삽입 (1문제)"),
+    (39, "38-39번: 문장 삽입 (1문제)"),
+    (40, "40번: 요약문 완성 (1문제)"),
+    (41, "41-42번: 장문 독해 (2문제)"),
+    (43, "43-45번: 복합 장문 (3문제)"),
+]
+
+
+def slot_topic(topic, number):
+    return f"{topic} (passage for question {number}: take a different angle from the other passages on this topic)"
+
+
+def _generate_with_retry(generate_fn, limiter, api_key, school_level, grade, topic, difficulty_level,
+                         question_type, max_retries, backoff, use_cache=True):
+    last_error = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            # Full jitter so retries from parallel workers don't line up
+            time.sleep(random.uniform(0, backoff * (2 ** (attempt - 1))))
+        limiter.acquire()
+        try:
+            result = generate_fn(api_key, school_level, grade, topic, difficulty_level, question_type,
+                                 use_cache=use_cache)
+        except Exception as e:
+            last_error = str(e)
+            continue
+        if "error" not in result:
+            return result, attempt + 1
+        last_error = result["error"]
+    return {"error": last_error}, max_retries + 1
+
+
+def merge_exam(parts, school_level, grade, difficulty_level):
+    # parts: list of (number, question_type, topic, result) in exam order.
+    # The merged document keeps the usual "questions" list so the grading
+    # form works unchanged, plus "sections" for rendering each passage.
+    sections = []
+    questions = []
+    vocabulary = []
+    seen_words = set()
+    failed = []
+
+    for number, question_type, topic, result in parts:
+        if "error" in result:
+            failed.append({"number": number, "type": question_type, "error": result["error"]})
+            continue
+        section_questions = result.get("questions", [])
+        sections.append({
+            "number": number,
+            "type": question_type,
+            "topic": topic,
+            "title": result.get("title", ""),
+            "passage": result.get("passage", ""),
+            "question_start": len(questions),
+            "question_count": len(section_questions),
+        })
+        for offset, q in enumerate(section_questions):
+            q = dict(q)
+            q["number"] = number + offset
+            questions.append(q)
+        for v in result.get("vocabulary", []):
+            word = v.get("word", "").strip().lower()
+            if word and word not in seen_words:
+                seen_words.add(word)
+                vocabulary.append(v)
+
+    return {
+        "title": f"실전 모의고사 18~45번 ({school_level} {grade}, {difficulty_level})",
+        "passage": "",
+        "sections": sections,
+        "questions": questions,
+        "vocabulary": vocabulary,
+        "failed": failed,
+    }
+
+
+def assemble_full_exam(generate_fn, api_key, school_level, grade, topics, difficulty_level,
+                       plan=FULL_EXAM_PLAN, max_workers=EXAM_MAX_WORKERS, per_minute=EXAM_PER_MINUTE,
+                       max_retries=EXAM_MAX_RETRIES, backoff=EXAM_BACKOFF_SECONDS, progress=None):
+    # progress(done, total, number, question_type, ok) is called from the
+    # calling thread, so it is safe to update Streamlit widgets from it.
+    limiter = RateLimiter(per_minute, burst=max_workers)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='exam') as executor:
+        futures = {}
+        types = [question_type for _, question_type in plan]
+        for i, (number, question_type) in enumerate(plan):
+            topic = topics[i % len(topics)]
+            # Slots sharing a type (31-34, 36-37, 38-39) would send identical
+            # prompts for one typed-in topic and get the same set back, so each
+            # gets its own angle and skips the cache
+            repeated = types.count(question_type) > 1
+            future = executor.submit(_generate_with_retry, generate_fn, limiter, api_key, school_level, grade,
+                                     slot_topic(topic, number) if repeated else topic, difficulty_level,
+                                     question_type, max_retries, backoff, use_cache=not repeated)
+            futures[future] = (number, question_type, topic)
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            number, question_type, topic = futures[future]
+            result, _ = future.result()
+            results[number] = (number, question_type, topic, result)
+            if progress:
+                progress(done, len(plan), number, question_type, "error" not in result)
+
+    parts = [results[number] for number, _ in plan]
+    if all("error" in part[3] for part in parts):
+        return {"error": parts[0][3]["error"]}
+    return merge_exam(parts, school_level, grade, difficulty_level)
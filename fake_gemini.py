@@ -0,0 +1,163 @@
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+
+# Local stand-in for google.generativeai, for benchmarks and offline runs.
+# install() puts a fake module in sys.modules before anything imports the
+# real one; FakeBehavior controls latency, streaming and injected failures.
+
+
+class FakeBehavior:
+    def __init__(self, latency=0.0, first_chunk_latency=None, chunk_size=200, chunk_delay=0.0,
+                 malformed_rate=0.0, not_found_rate=0.0, rate_limit_rate=0.0,
+                 missing_models=(), seed=0):
+        self.latency = latency
+        self.first_chunk_latency = latency if first_chunk_latency is None else first_chunk_latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.malformed_rate = malformed_rate
+        self.not_found_rate = not_found_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.missing_models = set(missing_models)
+        self.random = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def roll(self, rate):
+        with self._lock:
+            return rate > 0 and self.random.random() < rate
+
+
+_WORDS = ("the students noticed that climate policy shapes everyday choices while technology "
+          "offers new ways to measure progress and communities debate what fairness means").split()
+
+
+def make_problem_set(question_count=1, passage_words=300, vocab_count=8, seed=0):
+    rng = random.Random(seed)
+    passage = " ".join(rng.choice(_WORDS) for _ in range(passage_words))
+    return {
+        "title": "A Fake Passage",
+        "passage": passage[0].upper() + passage[1:] + ".",
+        "questions": [
+            {
+                "type": "Fake Type",
+                "question": f"다음 글의 내용과 일치하는 것은? ({i+1})",
+                "options": [f"{n}. option {n}" for n in range(1, 6)],
+                "answer": str(rng.randint(1, 5)),
+                "explanation": "가짜 해설입니다. " * 5,
+            }
+            for i in range(question_count)
+        ],
+        "vocabulary": [{"word": f"word{i}", "meaning": f"뜻{i}"} for i in range(vocab_count)],
+    }
+
+
+def _shape_from_prompt(prompt):
+    count = re.search(r'exactly (\d+) multiple-choice', prompt)
+    length = re.search(r'Length: (\d+)-(\d+) words', prompt) or re.search(r'(\d+)-(\d+) words \(Long Passage\)', prompt)
+    words = (int(length.group(1)) + int(length.group(2))) // 2 if length else 300
+    return (int(count.group(1)) if count else 1), words
+
+
+def _malform(text, rng):
+    # The defects real model output shows: trailing commas, stray quotes, truncation
+    kind = rng.choice(("trailing_comma", "stray_quote", "truncated"))
+    if kind == "trailing_comma":
+        return text.replace('"]', '",]', 1).replace('}]', '},]', 1)
+    if kind == "stray_quote":
+        return text.replace('students', 'the "students', 1)
+    return text[:int(len(text) * 0.85)]
+
+
+class FakeUsage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, prompt=""):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+
+class FakeStream:
+    def __init__(self, chunks, behavior, prompt):
+        self._chunks = chunks
+        self._behavior = behavior
+        self.text = "".join(chunks)
+        self.usage_metadata = FakeUsage(prompt, self.text)
+
+    def __iter__(self):
+        for i, chunk in enumerate(self._chunks):
+            if i and self._behavior.chunk_delay:
+                time.sleep(self._behavior.chunk_delay)
+            yield FakeResponse(chunk)
+
+
+class FakeGenerativeModel:
+    behavior = FakeBehavior()
+
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        behavior = self.behavior
+        with behavior._lock:
+            behavior.calls += 1
+        if self.model_name in behavior.missing_models or behavior.roll(behavior.not_found_rate):
+            raise Exception(f"404 models/{self.model_name} is not found for API version v1beta")
+        if behavior.roll(behavior.rate_limit_rate):
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+
+        question_count, passage_words = _shape_from_prompt(prompt)
+        text = json.dumps(make_problem_set(question_count, passage_words, seed=behavior.random.random()),
+                          ensure_ascii=False, indent=2)
+        if behavior.roll(behavior.malformed_rate):
+            text = _malform(text, behavior.random)
+
+        if not stream:
+            if behavior.latency:
+                time.sleep(behavior.latency)
+            return FakeResponse(text, prompt)
+        if behavior.first_chunk_latency:
+            time.sleep(behavior.first_chunk_latency)
+        size = max(1, behavior.chunk_size)
+        return FakeStream([text[i:i + size] for i in range(0, len(text), size)], behavior, prompt)
+
+
+def _list_models():
+    names = ["models/gemini-2.5-flash", "models/gemini-2.0-flash", "models/gemini-1.5-pro"]
+    missing = {f"models/{m}" if not m.startswith("models/") else m for m in FakeGenerativeModel.behavior.missing_models}
+    return [types.SimpleNamespace(name=n, supported_generation_methods=["generateContent"])
+            for n in names if n not in missing]
+
+
+def install(behavior=None):
+    # Returns the fake module; safe to call again to swap the behavior
+    if behavior is not None:
+        FakeGenerativeModel.behavior = behavior
+    module = sys.modules.get('google.generativeai')
+    if module is None or not getattr(module, 'IS_FAKE', False):
+        module = types.ModuleType('google.generativeai')
+        module.IS_FAKE = True
+        module.configure = lambda api_key=None, **kwargs: None
+        module.GenerativeModel = FakeGenerativeModel
+        module.list_models = _list_models
+        try:
+            import google
+        except ImportError:
+            google = types.ModuleType('google')
+            sys.modules['google'] = google
+        google.generativeai = module
+        sys.modules['google.generativeai'] = module
+    # Modules that already imported the real package keep their own reference
+    if 'gemini_client' in sys.modules:
+        sys.modules['gemini_client'].genai = module
+    return module
@@ -0,0 +1,250 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ratelimit import get_api_limiter
+
+# Long-lived Gemini clients, one per (api_key, model), with a cached list of
+# available models for 404 fallback and optional hedged requests.
+
+MODEL_LIST_TTL = int(os.environ.get('GEMINI_MODEL_LIST_TTL', '3600'))
+# Send a second copy of a request that hasn't answered after the observed p95
+# (time to first chunk for streams, total time otherwise)
+HEDGE_ENABLED = os.environ.get('GEMINI_HEDGE', '0') == '1'
+HEDGE_MIN_SAMPLES = 10
+HEDGE_DEFAULT_AFTER = float(os.environ.get('GEMINI_HEDGE_AFTER', '25'))
+LATENCY_WINDOW = 100
+GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '120'))
+
+# google.generativeai (and grpc under it) is slow to import, so it is only
+# loaded by the first request that actually goes to Gemini
+genai = None
+_import_lock = threading.Lock()
+
+# genai.configure() sets a process-wide default; only redo it when the key
+# changes. A GenerativeModel binds whatever default is configured at its first
+# generate_content(), so that call holds this lock too (see GeminiClient._bind)
+_configure_lock = threading.RLock()
+_configured_key = None
+
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='gemini-hedge')
+
+
+def _genai():
+    global genai
+    with _import_lock:
+        if genai is None:
+            import google.generativeai
+            genai = google.generativeai
+        return genai
+
+
+def _ensure_configured(api_key):
+    global _configured_key
+    with _configure_lock:
+        if _configured_key != api_key:
+            _genai().configure(api_key=api_key)
+            _configured_key = api_key
+
+
+def is_not_found(error):
+    return "404" in str(error)
+
+
+class ModelDirectory:
+    # Cached genai.list_models() filtered to models that support generateContent.
+    # A stale list is served while a background thread refreshes it.
+    def __init__(self, api_key, ttl=MODEL_LIST_TTL):
+        self.api_key = api_key
+        self.ttl = ttl
+        self._models = None
+        self._fetched_at = 0
+        self._refreshing = False
+        self._replacements = {}  # configured model -> fallback that answered
+        self._lock = threading.Lock()
+
+    def resolve(self, model_name):
+        # The model a request for `model_name` goes to first
+        with self._lock:
+            return self._replacements.get(model_name, model_name)
+
+    def replace(self, model_name, fallback):
+        with self._lock:
+            self._replacements[model_name] = fallback
+
+    def models(self, refresh=False):
+        with self._lock:
+            models = self._models
+            stale = time.time() - self._fetched_at > self.ttl
+            start_background = models is not None and stale and not self._refreshing and not refresh
+            if start_background:
+                self._refreshing = True
+        if models is None or refresh:
+            return self._fetch()
+        if start_background:
+            threading.Thread(target=self._fetch, daemon=True).start()
+        return models
+
+    def _fetch(self):
+        try:
+            with _configure_lock:
+                _ensure_configured(self.api_key)
+                models = [m.name for m in _genai().list_models() if 'generateContent' in m.supported_generation_methods]
+            available = {m.split('/')[-1] for m in models}
+            with self._lock:
+                self._models = models
+                self._fetched_at = time.time()
+                # A configured model that is listed again is tried again
+                self._replacements = {m: r for m, r in self._replacements.items()
+                                      if m.split('/')[-1] not in available}
+            return models
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def fallback_for(self, model_name, tried):
+        # Prefer another "flash" model, then anything that can generate content
+        candidates = [m for m in self.models() if m not in tried and m.split('/')[-1] not in tried]
+        candidates.sort(key=lambda m: ('flash' not in m, 'exp' in m or 'preview' in m))
+        return candidates[0] if candidates else None
+
+
+class GeminiClient:
+    def __init__(self, api_key, model_name, generation_config=None, directory=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.directory = directory or get_model_directory(api_key)
+        self._models = {}
+        self._bound = set()  # models whose first call has bound this client's key
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._ttfb = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def _model(self, model_name):
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                # Bound to a key at its first call, in _bind
+                model = _genai().GenerativeModel(model_name, generation_config=self.generation_config)
+                self._models[model_name] = model
+            return model
+
+    def hedge_after(self, stream=False):
+        with self._lock:
+            samples = sorted(self._ttfb if stream else self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_AFTER
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def current_model(self):
+        return self.directory.resolve(self.model_name)
+
+    def generate(self, prompt, stream=False, hedge=None):
+        return self.generate_with_model(prompt, stream, hedge)[0]
+
+    def generate_with_model(self, prompt, stream=False, hedge=None):
+        # Returns (response, model that produced it). On 404 the request is
+        # retried on the next available model; the directory remembers which
+        # one answered, so later requests with this key start there.
+        tried = []
+        model_name = self.current_model()
+        while True:
+            tried.append(model_name)
+            try:
+                response = self._generate_once(model_name, prompt, stream, HEDGE_ENABLED if hedge is None else hedge)
+            except Exception as e:
+                if not is_not_found(e):
+                    raise
+                fallback = self.directory.fallback_for(model_name, tried)
+                if fallback is None:
+                    raise
+                model_name = fallback
+                continue
+            if model_name != tried[0]:
+                self.directory.replace(self.model_name, model_name)
+            return response, model_name
+
+    def _bind(self, model_name, call):
+        # Until a model has made one call it has no client of its own, and
+        # another key configured in between would be bound (and billed) for
+        # good; the configure lock is held until the first call has started
+        with self._lock:
+            bound = model_name in self._bound
+        if bound:
+            return call()
+        with _configure_lock:
+            _ensure_configured(self.api_key)
+            try:
+                return call()
+            finally:
+                with self._lock:
+                    self._bound.add(model_name)
+
+    def _generate_once(self, model_name, prompt, stream, hedge):
+        model = self._model(model_name)
+        options = {"timeout": GEMINI_TIMEOUT}
+        if stream:
+            # Holding the lock only until the stream is opened, not read
+            call = lambda: _started(self._bind(
+                model_name, lambda: model.generate_content(prompt, stream=True, request_options=options)))
+        else:
+            call = lambda: self._bind(model_name, lambda: model.generate_content(prompt, request_options=options))
+
+        started = time.monotonic()
+        response = self._hedged(call, stream) if hedge else call()
+        with self._lock:
+            (self._ttfb if stream else self._latencies).append(time.monotonic() - started)
+        return response
+
+    def _hedged(self, call, stream):
+        first = _hedge_executor.submit(call)
+        done, _ = wait([first], timeout=self.hedge_after(stream))
+        # The second copy is a real API call, so it needs its own token;
+        # without one we just keep waiting on the first
+        if done or not get_api_limiter().try_acquire():
+            return first.result()
+        second = _hedge_executor.submit(call)
+        pending = {first, second}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [f for f in done if f.exception() is None]
+            if succeeded:
+                # A losing stream is never read and is closed when collected
+                return succeeded[0].result()
+            if not pending:
+                return done.pop().result()  # Both failed: raise
+
+
+def _started(response):
+    # Waits for a stream's first chunk, so its latency is time to first chunk
+    chunks = iter(response)
+    first = next(chunks, None)
+    return iter(()) if first is None else itertools.chain([first], chunks)
+
+
+_clients = {}
+_directories = {}
+_registry_lock = threading.RLock()
+
+
+def get_model_directory(api_key):
+    with _registry_lock:
+        if api_key not in _directories:
+            _directories[api_key] = ModelDirectory(api_key)
+        return _directories[api_key]
+
+
+def get_client(api_key, model_name, generation_config=None):
+    key = (api_key, model_name, repr(generation_config))
+    with _registry_lock:
+        if key not in _clients:
+            _clients[key] = GeminiClient(api_key, model_name, generation_config)
+        return _clients[key]
+
+
+def list_generate_models(api_key, refresh=False):
+    return get_model_directory(api_key).models(refresh=refresh)
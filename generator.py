@@ -0,0 +1,473 @@
+import copy
+import json
+import re
+import time
+
+from cache import get_cache, make_cache_key
+from ratelimit import API_WAIT_SECONDS, get_api_limiter
+from singleflight import SINGLE_FLIGHT_WAIT_SECONDS, get_single_flight
+from stream_parser import ProblemSetStreamParser
+from history_store import get_history_store, passage_text
+from dedup import DEDUP_POLICY, avoid_hint, get_sketch_index, signature
+from vocab_index import get_vocab_index
+from gemini_client import is_not_found, list_generate_models
+from providers import LLM_PROVIDERS, get_router
+from metrics import get_metrics, span, usage_tokens
+from question_types import estimate_tokens, get_question_type, listed_question_types
+from model_output import parse_json_object, parse_problem_set, validate_question, validate_vocabulary
+
+# Problem-set generation and history, usable without Streamlit
+# (app.py and batch.py both import from here).
+
+# --- Constants ---
+TOPICS = [
+    "환경 문제 (Environmental Issues)",
+    "과학 기술 (Science & Technology)",
+    "인공지능과 윤리 (AI & Ethics)",
+    "문화적 다양성 (Cultural Diversity)",
+    "역사와 전통 (History & Tradition)",
+    "경제와 소비 (Economy & Consumption)",
+    "심리학과 인간 행동 (Psychology & Human Behavior)",
+    "예술과 문학 (Art & Literature)",
+    "진로와 직업 (Career & Jobs)",
+    "건강과 운동 (Health & Exercise)"
+]
+QUESTION_TYPES = listed_question_types()
+
+# Using 'gemini-2.5-flash' as it is the current standard available model.
+MODEL_NAME = 'gemini-2.5-flash'
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# --- Functions ---
+def save_to_history(data, topic, school_level=None, grade=None, question_type=None, difficulty=None, namespace=""):
+    # Returns the id of the new history entry; namespace "" is the shared history
+    with span("history_save"):
+        store = get_history_store()
+        entry_id = store.save(data, topic, school_level=school_level, grade=grade,
+                              question_type=question_type, difficulty=difficulty, namespace=namespace)
+        get_vocab_index().add(entry_id, data, school_level, grade)
+        sig = signature(passage_text(data))
+        if sig is not None:
+            store.put_sketch(entry_id, sig.tobytes())
+            # The in-memory index (and its one-time scan of older sets) is
+            # only built when dedup is on; the stored sketch is enough otherwise
+            if DEDUP_POLICY != "off":
+                get_sketch_index().add_saved(entry_id, sig, data.get("title", ""), namespace)
+        return entry_id
+
+def load_from_history(entry_id):
+    with span("history_load"):
+        return get_history_store().get(entry_id)
+
+def get_history_files(page=1, page_size=20, search=None, namespace=None, **filters):
+    # Returns (entries on this page, total matching entries), newest first
+    with span("history_query"):
+        return get_history_store().query(page=page, page_size=page_size, search=search, namespace=namespace,
+                                         **filters)
+
+def delete_history_file(entry_id):
+    with span("history_delete"):
+        get_history_store().delete(entry_id)
+        get_vocab_index().remove(entry_id)
+        if DEDUP_POLICY != "off":
+            get_sketch_index().remove(entry_id)
+
+def update_history_entry(entry_id, data):
+    # After a partial regeneration; the vocabulary may have changed
+    store = get_history_store()
+    store.update_data(entry_id, data)
+    meta = store.get_meta(entry_id)
+    if meta:
+        get_vocab_index().add(entry_id, data, meta["school_level"], meta["grade"])
+
+def metric_labels(school_level, grade, question_type):
+    return {"question_type": question_type, "grade": f"{school_level} {grade}"}
+
+def normalize_topic(topic):
+    # "  K-Pop " and "K-Pop" should share a cache entry
+    return re.sub(r'\s+', ' ', topic).strip()
+
+def build_prompt(school_level, grade, topic, difficulty_level, question_type):
+    # Templates are precompiled per type in question_types.py
+    return get_question_type(question_type).render(school_level, grade, normalize_topic(topic), difficulty_level)
+
+def parse_model_json(text_response, expected_questions=None):
+    # Repairs and validates in one pass; salvageable defects only add "warnings"
+    data, diagnostics = parse_problem_set(text_response)
+    if data is None:
+        return {"error": "응답을 해석하지 못했습니다.\n" + "\n".join(diagnostics)}
+    if expected_questions and len(data["questions"]) != expected_questions:
+        diagnostics.append(f"요청한 문제 수({expected_questions})와 받은 문제 수({len(data['questions'])})가 다릅니다.")
+    if diagnostics:
+        data["warnings"] = diagnostics
+    return data
+
+# --- Near-duplicate handling ---
+def find_duplicates(passage, namespace=""):
+    # Returns (signature, earlier passages in this namespace above the similarity threshold)
+    sig = signature(passage)
+    return sig, (get_sketch_index().similar(sig, namespace=namespace) if sig is not None else [])
+
+def serve_duplicate(matches):
+    # Under the "serve" policy the most similar saved set replaces the new one
+    saved = [m for m in matches if isinstance(m[0], int)]
+    if DEDUP_POLICY != "serve" or not saved:
+        return None
+    set_id, score, _ = saved[0]
+    try:
+        data = load_from_history(set_id)
+    except KeyError:
+        return None
+    data["duplicate_of"] = set_id
+    data["warnings"] = list(data.get("warnings", [])) + [
+        f"비슷한 지문(유사도 {score:.0%})이 히스토리에 있어 새로 만들지 않고 불러왔습니다."]
+    return data
+
+def lookup_key(api_key, prompt, stream=False):
+    # Cache lookups use the model a request would reach now; results are
+    # stored under the model that actually answered (after a 404 fallback
+    # or a router failover the two differ)
+    return make_cache_key(get_router(api_key, MODEL_NAME, GENERATION_CONFIG).current_model(stream), prompt)
+
+def flight_key(cache_key, namespace):
+    # Under "serve" the result can be a set from the caller's own history,
+    # so namespaces must not share an in-flight call
+    return (cache_key, namespace) if DEDUP_POLICY == "serve" else cache_key
+
+def remember_passage(data, namespace=""):
+    sig = signature(passage_text(data))
+    if sig is not None:
+        get_sketch_index().add_unsaved(sig, data.get("title", ""), namespace)
+
+def describe_api_error(api_key, e):
+    error_msg = str(e)
+    if is_not_found(e) and api_key and "gemini" in LLM_PROVIDERS:
+        try:
+            # Served from the cached model list, not a fresh list_models() call
+            available_models = list_generate_models(api_key)
+            return f"지정한 모델을 찾을 수 없습니다. (404 Error)\n\n현재 사용 가능한 모델 목록:\n{', '.join(available_models)}\n\n상세 에러: {error_msg}"
+        except Exception as list_e:
+            return f"모델을 찾을 수 없으며, 목록 조회도 실패했습니다.\n{error_msg}"
+    return error_msg
+
+def replay_events(data):
+    # The events a stream would have produced, for a set that already exists
+    for key in ("title", "passage"):
+        if key in data:
+            yield ("field", key, data[key])
+    for idx, q in enumerate(data.get("questions", [])):
+        yield ("question", idx, q)
+    yield ("done", data)
+
+def wait_for_api(labels=None):
+    # Every API call in the process draws from one token bucket; called
+    # before the model timers start so queueing shows up as its own stage
+    with span("api_queue", **(labels or {})):
+        if not get_api_limiter().acquire(timeout=API_WAIT_SECONDS):
+            raise RuntimeError("요청이 많아 차례를 기다리다 시간이 초과되었습니다. 잠시 후 다시 시도해주세요.")
+
+def call_model(client, prompt, stream=False, labels=None):
+    # The caller has already waited for an API token (wait_for_api)
+    if stream:
+        return client.generate(prompt, stream=True)
+    # A blocking call's first byte arrives with the whole response; streams
+    # record their own model_ttfb in _stream_events
+    started = time.perf_counter()
+    response = client.generate(prompt)
+    get_metrics().record("model_ttfb", time.perf_counter() - started, {**(labels or {}), "mode": "blocking"})
+    return response
+
+def generate_problem_set(api_key, school_level, grade, topic, difficulty_level, question_type, use_cache=True,
+                         namespace=""):
+    labels = metric_labels(school_level, grade, question_type)
+    with span("prompt_build", **labels) as s:
+        prompt = build_prompt(school_level, grade, topic, difficulty_level, question_type)
+        s.set(prompt_chars=len(prompt), prompt_tokens_est=estimate_tokens(prompt))
+    expected_questions = get_question_type(question_type).question_count
+
+    cache = get_cache()
+    cache_key = lookup_key(api_key, prompt)
+    if not use_cache:
+        return _generate_fresh(api_key, prompt, labels, expected_questions, namespace)
+    with span("cache_lookup", **labels):
+        cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    def lookup_or_generate():
+        # Another caller may have filled the cache while we were checking
+        return cache.get(cache_key, count_miss=False) or _generate_fresh(api_key, prompt, labels, expected_questions, namespace)
+
+    # Identical requests from other sessions share this call
+    return get_single_flight().do(flight_key(cache_key, namespace), lookup_or_generate)
+
+def _generate_fresh(api_key, prompt, labels, expected_questions, namespace):
+    # Long-lived clients behind a latency-aware router; Gemini falls back to another model on 404
+    client = get_router(api_key, MODEL_NAME, GENERATION_CONFIG)
+
+    try:
+        wait_for_api(labels)
+        with span("model_total", **labels) as s:
+            response = call_model(client, prompt, labels=labels)
+            s.set(response_chars=len(response.text), **usage_tokens(response))
+        with span("parse", **labels):
+            data = parse_model_json(response.text, expected_questions)
+        if "error" in data:
+            return data
+        if DEDUP_POLICY != "off":
+            with span("dedup_check", **labels):
+                _, matches = find_duplicates(passage_text(data), namespace)
+            if matches:
+                get_metrics().record("dedup_hit", 0.0, labels, similarity=matches[0][1])
+                served = serve_duplicate(matches)
+                if served is not None:
+                    return served
+                # One more try, told what to stay away from
+                wait_for_api(labels)
+                with span("model_total", retry="avoid", **labels) as s:
+                    response = call_model(client, prompt + avoid_hint(matches), labels=labels)
+                    s.set(response_chars=len(response.text), **usage_tokens(response))
+                retried = parse_model_json(response.text, expected_questions)
+                if "error" not in retried:
+                    data = retried
+            remember_passage(data, namespace)
+        # A salvaged or short set is shown once but not cached for everyone
+        if not data.get("warnings"):
+            get_cache().put(make_cache_key(response.model_name, prompt), data)
+        return data
+    except Exception as e:
+        get_metrics().record("model_error", 0.0, labels, error=str(e)[:200])
+        return {"error": describe_api_error(api_key, e)}
+
+def generate_problem_set_stream(api_key, school_level, grade, topic, difficulty_level, question_type, use_cache=True,
+                                namespace=""):
+    # Same as generate_problem_set, but yields parts as soon as they are complete:
+    # ("field", key, value), ("question", index, question), then ("done", data) or ("error", message)
+    labels = metric_labels(school_level, grade, question_type)
+    with span("prompt_build", **labels) as s:
+        prompt = build_prompt(school_level, grade, topic, difficulty_level, question_type)
+        s.set(prompt_chars=len(prompt), prompt_tokens_est=estimate_tokens(prompt))
+    expected_questions = get_question_type(question_type).question_count
+
+    cache = get_cache()
+    cache_key = lookup_key(api_key, prompt, stream=True)
+    if not use_cache:
+        yield from _stream_fresh(api_key, prompt, labels, expected_questions, namespace)
+        return
+    cached = cache.get(cache_key)
+    if cached is not None:
+        yield from replay_events(cached)
+        return
+
+    # An identical request already in flight (streamed or not) is waited
+    # for and replayed; if it takes too long this one goes on its own
+    flight = get_single_flight()
+    key = flight_key(cache_key, namespace)
+    future, leader = flight.begin(key)
+    if not leader:
+        try:
+            data = copy.deepcopy(future.result(timeout=SINGLE_FLIGHT_WAIT_SECONDS))
+        except Exception:
+            data = None
+        if data is not None:
+            if "error" in data:
+                yield ("error", data["error"])
+            else:
+                yield from replay_events(data)
+            return
+        yield from _stream_fresh(api_key, prompt, labels, expected_questions, namespace)
+        return
+
+    outcome = {"error": "생성이 중단되었습니다."}
+    try:
+        for event in _stream_fresh(api_key, prompt, labels, expected_questions, namespace):
+            if event[0] == "done":
+                outcome = event[1]
+            elif event[0] == "error":
+                outcome = {"error": event[1]}
+            yield event
+    finally:
+        # Also runs when the caller stops reading, so followers never hang
+        flight.finish(key, future, outcome)
+
+def _stream_fresh(api_key, prompt, labels, expected_questions, namespace):
+    client = get_router(api_key, MODEL_NAME, GENERATION_CONFIG)
+
+    metrics = get_metrics()
+    try:
+        request_prompt = prompt
+        for attempt in range(2):
+            parser = ProblemSetStreamParser()
+            duplicates = None
+            for event in _stream_events(client, request_prompt, labels, parser):
+                if event[0] == "model":
+                    model_used = event[1]
+                    continue
+                # The passage arrives before the questions, so a repeat is
+                # caught before most of the output is paid for
+                if attempt == 0 and DEDUP_POLICY != "off" and event[:2] == ("field", "passage"):
+                    _, matches = find_duplicates(event[2], namespace)
+                    if matches:
+                        duplicates = matches
+                        break
+                yield event
+            if duplicates is None:
+                break
+            metrics.record("dedup_hit", 0.0, labels, similarity=duplicates[0][1], streamed=True)
+            served = serve_duplicate(duplicates)
+            if served is not None:
+                yield from replay_events(served)
+                return
+            request_prompt = prompt + avoid_hint(duplicates)
+
+        with span("parse", **labels):
+            data = parse_model_json(parser.text, expected_questions)
+        if "error" in data:
+            yield ("error", data["error"])
+            return
+        if DEDUP_POLICY != "off":
+            remember_passage(data, namespace)
+        if not data.get("warnings"):
+            get_cache().put(make_cache_key(model_used, prompt), data)
+        yield ("done", data)
+    except Exception as e:
+        metrics.record("model_error", 0.0, labels, error=str(e)[:200])
+        yield ("error", describe_api_error(api_key, e))
+
+def _stream_events(client, prompt, labels, parser):
+    # Only time spent waiting on the model counts, not the caller's rendering
+    metrics = get_metrics()
+    wait_for_api(labels)
+    started = time.perf_counter()
+    stream = call_model(client, prompt, stream=True)
+    # Internal: tells _stream_fresh which model answered
+    yield ("model", stream.model_name)
+    chunks = iter(stream)
+    # The router and hedging may already have waited for the first chunk
+    model_seconds = time.perf_counter() - started
+    chunk = None
+    while True:
+        waited = time.perf_counter()
+        last_chunk, chunk = chunk, next(chunks, None)
+        model_seconds += time.perf_counter() - waited
+        if chunk is None:
+            break
+        if last_chunk is None:
+            metrics.record("model_ttfb", time.perf_counter() - started, {**labels, "mode": "stream"})
+        for event in parser.feed(chunk.text):
+            yield event
+    metrics.record("model_total", model_seconds, labels, response_chars=len(parser.text),
+                   **usage_tokens(last_chunk))
+
+def passage_for_question(problem_set, index):
+    # In a full mock exam each question belongs to one section's passage
+    for section in problem_set.get('sections', []):
+        if section['question_start'] <= index < section['question_start'] + section['question_count']:
+            return section['passage']
+    return problem_set.get('passage', '')
+
+def build_partial_prompt(problem_set, part, index=None):
+    questions = problem_set.get('questions', [])
+    if part == "question":
+        old_question = questions[index]
+        return f"""
+    You are an expert English teacher for Korean students, specialized in creating content for the Korean CSAT (Sooneung) and Mock Exams.
+    The reading passage below already exists. Write ONE replacement for the question shown, of the same type, for the SAME passage.
+
+    **Passage**:
+    {passage_for_question(problem_set, index)}
+
+    **Question to replace** (type: {old_question.get('type', '')}):
+    {json.dumps(old_question, ensure_ascii=False)}
+
+    **Requirements**:
+    - Do NOT rewrite the passage. If the question type needs markers such as (1)~(5), (a)~(e) or '_______', use the markers that already appear in the passage.
+    - 5 options, the correct answer number, and a detailed explanation in Korean.
+
+    **Output Format**:
+    Return ONLY a valid JSON object:
+    {{
+        "question": {{
+            "type": "Type Name",
+            "question": "Question Text...",
+            "options": ["1. A", "2. B", "3. C", "4. D", "5. E"],
+            "answer": "3",
+            "explanation": "..."
+        }}
+    }}
+    """
+    if part == "vocabulary":
+        return f"""
+    You are an expert English teacher for Korean students.
+    Extract 5-10 difficult vocabulary words or idioms from the passage below and provide their Korean meanings.
+
+    **Passage**:
+    {problem_set.get('passage', '') or chr(10).join(s['passage'] for s in problem_set.get('sections', []))}
+
+    **Output Format**:
+    Return ONLY a valid JSON object:
+    {{
+        "vocabulary": [
+            {{ "word": "example word", "meaning": "예시 단어 뜻" }}
+        ]
+    }}
+    """
+    # part == "explanations"
+    slim_questions = [
+        {"question": q.get('question', ''), "options": q.get('options', []), "answer": q.get('answer', '')}
+        for q in questions
+    ]
+    return f"""
+    You are an expert English teacher for Korean students, specialized in the Korean CSAT (Sooneung).
+    For each question below about the passage, write a detailed explanation in Korean of why the given answer is correct.
+
+    **Passage**:
+    {problem_set.get('passage', '') or chr(10).join(s['passage'] for s in problem_set.get('sections', []))}
+
+    **Questions** (in order):
+    {json.dumps(slim_questions, ensure_ascii=False)}
+
+    **Output Format**:
+    Return ONLY a valid JSON object with exactly {len(questions)} explanations, in the same order:
+    {{
+        "explanations": ["...", "..."]
+    }}
+    """
+
+def regenerate_part(api_key, problem_set, part, index=None):
+    # Regenerates only question `index`, the "vocabulary" or the "explanations"
+    # against the existing passage, and returns a merged copy of the set.
+    prompt = build_partial_prompt(problem_set, part, index)
+    client = get_router(api_key, MODEL_NAME, GENERATION_CONFIG)
+    try:
+        wait_for_api({"part": part})
+        with span("model_partial", part=part) as s:
+            response = call_model(client, prompt, labels={"part": part})
+            s.set(response_chars=len(response.text), **usage_tokens(response))
+    except Exception as e:
+        return {"error": describe_api_error(api_key, e)}
+
+    data, diagnostics = parse_json_object(response.text)
+    if not isinstance(data, dict):
+        return {"error": "응답을 해석하지 못했습니다.\n" + "\n".join(diagnostics)}
+
+    merged = copy.deepcopy(problem_set)
+    if part == "question":
+        question, problems = validate_question(data.get("question", data), index)
+        if question is None:
+            return {"error": "\n".join(problems)}
+        if "number" in merged['questions'][index]:
+            question["number"] = merged['questions'][index]["number"]
+        merged['questions'][index] = question
+    elif part == "vocabulary":
+        vocabulary = validate_vocabulary(data.get("vocabulary"))
+        if not vocabulary:
+            return {"error": "어휘 목록을 받지 못했습니다."}
+        merged['vocabulary'] = vocabulary
+    else:
+        explanations = data.get("explanations")
+        if not isinstance(explanations, list) or len(explanations) != len(merged['questions']):
+            return {"error": "해설 개수가 문제 수와 맞지 않습니다."}
+        for q, explanation in zip(merged['questions'], explanations):
+            q['explanation'] = str(explanation).strip()
+    return merged
@@ -0,0 +1,365 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+# SQLite-backed history of generated problem sets.
+# Metadata columns are indexed for filtering/sorting and passages are
+# full-text indexed (FTS5, falling back to LIKE when it is unavailable).
+
+HISTORY_DB = os.environ.get('HISTORY_DB', 'history.db')
+LEGACY_HISTORY_DIR = 'history'
+
+FILTER_COLUMNS = ("topic", "school_level", "grade", "question_type", "difficulty")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS problem_sets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    topic TEXT,
+    school_level TEXT,
+    grade TEXT,
+    question_type TEXT,
+    difficulty TEXT,
+    title TEXT,
+    score REAL,
+    source_file TEXT UNIQUE,
+    data TEXT NOT NULL,
+    namespace TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_sets_created_at ON problem_sets (created_at);
+CREATE INDEX IF NOT EXISTS idx_sets_topic ON problem_sets (topic, created_at);
+CREATE INDEX IF NOT EXISTS idx_sets_school_grade ON problem_sets (school_level, grade, created_at);
+CREATE INDEX IF NOT EXISTS idx_sets_question_type ON problem_sets (question_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_sets_score ON problem_sets (score);
+CREATE TABLE IF NOT EXISTS vocabulary (
+    set_id INTEGER NOT NULL,
+    word_key TEXT NOT NULL,
+    word TEXT NOT NULL,
+    meaning TEXT,
+    grade_level TEXT,
+    position INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_vocab_word ON vocabulary (word_key);
+CREATE INDEX IF NOT EXISTS idx_vocab_set ON vocabulary (set_id);
+CREATE TABLE IF NOT EXISTS passage_sketches (
+    set_id INTEGER PRIMARY KEY,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS problem_sets_fts USING fts5(title, passage)"
+
+_LIST_COLUMNS = "id, created_at, topic, school_level, grade, question_type, difficulty, title, score"
+
+
+def passage_text(data):
+    # A full mock exam keeps its passages in sections
+    parts = [data.get("passage", "")]
+    parts.extend(section.get("passage", "") for section in data.get("sections", []))
+    return "\n".join(p for p in parts if p)
+
+
+def word_key(word):
+    # "Take  Part In!" and "take part in" are the same entry
+    return re.sub(r"[^\w'\- ]+", "", re.sub(r'\s+', ' ', word)).strip().lower()
+
+
+def vocabulary_rows(data):
+    # (word_key, word, meaning, position of the word in the passage or None)
+    passage = passage_text(data).lower()
+    rows = []
+    for item in data.get("vocabulary") or []:
+        if not isinstance(item, dict) or not str(item.get("word", "")).strip():
+            continue
+        word = str(item["word"]).strip()
+        key = word_key(word)
+        if not key:
+            continue
+        position = passage.find(key)
+        rows.append((key, word, str(item.get("meaning", "")).strip(), position if position >= 0 else None))
+    return rows
+
+
+def grade_level(school_level, grade):
+    return " ".join(p for p in (school_level, grade) if p) or None
+
+
+def _fts_query(search):
+    # Quote every term so user input can't break the FTS5 query syntax
+    terms = [t.replace('"', '""') for t in search.split()]
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+class HistoryStore:
+    def __init__(self, path=HISTORY_DB, archive=None):
+        # With an archive (archive.HistoryArchive) the set JSON lives there
+        # and the data column is left empty
+        self.path = path
+        self.archive = archive
+        self._lock = threading.Lock()
+        # Several server processes may share the file: wait for their locks
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(problem_sets)")}
+        if "namespace" not in columns:
+            self._conn.execute("ALTER TABLE problem_sets ADD COLUMN namespace TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sets_namespace ON problem_sets (namespace, created_at)")
+        try:
+            self._conn.execute(_FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False
+        self._conn.commit()
+
+    # --- Writes ---
+    def save(self, data, topic, school_level=None, grade=None, question_type=None, difficulty=None,
+             created_at=None, source_file=None, namespace=""):
+        created_at = created_at or datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO problem_sets (created_at, topic, school_level, grade, question_type, difficulty,"
+                " title, source_file, data, namespace) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (created_at, topic, school_level, grade, question_type, difficulty,
+                 data.get("title", ""), source_file, self._payload(data), namespace or ""),
+            )
+            set_id = cur.lastrowid
+            if self.archive is not None:
+                self.archive.put(set_id, data)
+            if self.has_fts:
+                self._conn.execute("INSERT INTO problem_sets_fts (rowid, title, passage) VALUES (?, ?, ?)",
+                                   (set_id, data.get("title", ""), passage_text(data)))
+            self._insert_vocabulary(set_id, data, grade_level(school_level, grade))
+        return set_id
+
+    def _insert_vocabulary(self, set_id, data, level):
+        self._conn.executemany(
+            "INSERT INTO vocabulary (set_id, word_key, word, meaning, grade_level, position) VALUES (?, ?, ?, ?, ?, ?)",
+            [(set_id, key, word, meaning, level, position) for key, word, meaning, position in vocabulary_rows(data)],
+        )
+
+    def update_data(self, set_id, data):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE problem_sets SET data = ?, title = ? WHERE id = ?",
+                               (self._payload(data), data.get("title", ""), set_id))
+            if self.archive is not None:
+                self.archive.put(set_id, data)
+            if self.has_fts:
+                self._conn.execute("DELETE FROM problem_sets_fts WHERE rowid = ?", (set_id,))
+                self._conn.execute("INSERT INTO problem_sets_fts (rowid, title, passage) VALUES (?, ?, ?)",
+                                   (set_id, data.get("title", ""), passage_text(data)))
+            row = self._conn.execute("SELECT school_level, grade FROM problem_sets WHERE id = ?", (set_id,)).fetchone()
+            self._conn.execute("DELETE FROM vocabulary WHERE set_id = ?", (set_id,))
+            if row is not None:
+                self._insert_vocabulary(set_id, data, grade_level(row["school_level"], row["grade"]))
+
+    def set_score(self, set_id, score):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE problem_sets SET score = ? WHERE id = ?", (score, set_id))
+
+    def delete(self, set_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM problem_sets WHERE id = ?", (set_id,))
+            if self.has_fts:
+                self._conn.execute("DELETE FROM problem_sets_fts WHERE rowid = ?", (set_id,))
+            self._conn.execute("DELETE FROM vocabulary WHERE set_id = ?", (set_id,))
+            self._conn.execute("DELETE FROM passage_sketches WHERE set_id = ?", (set_id,))
+            if self.archive is not None:
+                self.archive.delete(set_id)
+
+    def _payload(self, data):
+        return "" if self.archive is not None else json.dumps(data, ensure_ascii=False)
+
+    def _data(self, set_id, payload):
+        # Sets saved before the archive was enabled still have their JSON inline
+        return json.loads(payload) if payload else self.archive.get(set_id)
+
+    def put_sketch(self, set_id, signature):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO passage_sketches (set_id, signature) VALUES (?, ?)",
+                               (set_id, signature))
+
+    # --- Reads ---
+    def get(self, set_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM problem_sets WHERE id = ?", (set_id,)).fetchone()
+        if row is None:
+            raise KeyError(set_id)
+        return self._data(set_id, row["data"])
+
+    def get_meta(self, set_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_LIST_COLUMNS} FROM problem_sets WHERE id = ?", (set_id,)).fetchone()
+        return dict(row) if row else None
+
+    def query(self, page=1, page_size=20, search=None, min_score=None, max_score=None, namespace=None, **filters):
+        # Returns (rows for the page, total matching rows), newest first.
+        # namespace=None lists every namespace.
+        where = []
+        params = []
+        if namespace is not None:
+            where.append("namespace = ?")
+            params.append(namespace)
+        for column in FILTER_COLUMNS:
+            if filters.get(column):
+                where.append(f"{column} = ?")
+                params.append(filters[column])
+        if min_score is not None:
+            where.append("score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            where.append("score <= ?")
+            params.append(max_score)
+        if search and search.strip():
+            if self.has_fts:
+                where.append("id IN (SELECT rowid FROM problem_sets_fts WHERE problem_sets_fts MATCH ?)")
+                params.append(_fts_query(search))
+            else:
+                where.append("(title LIKE ? OR data LIKE ?)")
+                params.extend([f"%{search.strip()}%"] * 2)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM problem_sets {clause}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {_LIST_COLUMNS} FROM problem_sets {clause} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [page_size, max(0, page - 1) * page_size],
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def vocabulary(self, set_id=None):
+        # Flat rows of the vocabulary table, without parsing any set JSON
+        sql = "SELECT set_id, word_key, word, meaning, grade_level, position FROM vocabulary"
+        with self._lock:
+            if set_id is None:
+                rows = self._conn.execute(sql).fetchall()
+            else:
+                rows = self._conn.execute(sql + " WHERE set_id = ?", (set_id,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def sketches(self):
+        # (set_id, signature bytes, title, namespace) for every set that has a sketch
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.set_id, s.signature, p.title, p.namespace FROM passage_sketches s "
+                "JOIN problem_sets p ON p.id = s.set_id"
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def unsketched(self):
+        # Sets saved before sketches existed, or by an older version
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, title, namespace, data FROM problem_sets WHERE id NOT IN (SELECT set_id FROM passage_sketches)"
+            ).fetchall()
+        return [(row["id"], row["title"], row["namespace"], self._data(row["id"], row["data"])) for row in rows]
+
+    def distinct(self, column, namespace=None):
+        if column not in FILTER_COLUMNS:
+            raise ValueError(column)
+        clause, params = ("AND namespace = ?", [namespace]) if namespace is not None else ("", [])
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT {column} FROM problem_sets WHERE {column} IS NOT NULL {clause} ORDER BY {column}",
+                params,
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    # --- Legacy import ---
+    def import_json_dir(self, directory=LEGACY_HISTORY_DIR, once=True):
+        # One-time import of the old history/*.json files; safe to call again
+        # because source_file is unique.
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'legacy_import'").fetchone()
+        if done and once or not os.path.isdir(directory):
+            return 0
+
+        imported = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            created_at, topic = _parse_legacy_filename(name)
+            try:
+                self.save(data, topic, created_at=created_at, source_file=path)
+                imported += 1
+            except sqlite3.IntegrityError:
+                pass
+
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_import', ?)",
+                               (datetime.now().isoformat(timespec='seconds'),))
+        return imported
+
+    def index_vocabulary(self):
+        # One-time fill of the vocabulary table for databases created before
+        # it existed; later saves and deletes keep it current.
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT value FROM meta WHERE key = 'vocabulary_index'").fetchone():
+                return
+            rows = self._conn.execute("SELECT id, school_level, grade, data FROM problem_sets").fetchall()
+            self._conn.execute("DELETE FROM vocabulary")
+            for row in rows:
+                self._insert_vocabulary(row["id"], self._data(row["id"], row["data"]),
+                                        grade_level(row["school_level"], row["grade"]))
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('vocabulary_index', ?)",
+                               (datetime.now().isoformat(timespec='seconds'),))
+
+    def migrate_to_archive(self, batch=500):
+        # Moves inline JSON payloads into the archive, a batch per transaction
+        if self.archive is None:
+            raise ValueError("no archive configured")
+        moved = 0
+        while True:
+            with self._lock, self._conn:
+                rows = self._conn.execute("SELECT id, data FROM problem_sets WHERE data != '' LIMIT ?",
+                                          (batch,)).fetchall()
+                for row in rows:
+                    self.archive.put(row["id"], json.loads(row["data"]))
+                    self._conn.execute("UPDATE problem_sets SET data = '' WHERE id = ?", (row["id"],))
+            moved += len(rows)
+            if len(rows) < batch:
+                break
+        self.archive.flush()
+        return moved
+
+
+def _parse_legacy_filename(name):
+    # "20250101_120000_환경_문제__Environmental_Issues_.json"
+    match = re.match(r'(\d{8})_(\d{6})_(.*)\.json$', name)
+    if not match:
+        return None, name[:-5]
+    created_at = datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S").isoformat()
+    topic = re.sub(r'_+', ' ', match.group(3)).strip()
+    return created_at, topic
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_history_store():
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            archive = None
+            if os.environ.get('HISTORY_ARCHIVE_DIR'):
+                from archive import HistoryArchive
+                archive = HistoryArchive(os.environ['HISTORY_ARCHIVE_DIR'])
+            _default_store = HistoryStore(archive=archive)
+            _default_store.import_json_dir()
+            _default_store.index_vocabulary()
+        return _default_store
@@ -0,0 +1,198 @@
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Per-stage latency and token metrics.
+# Every span is appended to a rotating JSON-lines file and kept in a bounded
+# in-memory window per (stage, labels) series for p50/p95/p99 summaries and
+# a Prometheus text snapshot.
+
+METRICS_FILE = os.environ.get('METRICS_FILE', os.path.join('metrics', 'metrics.jsonl'))
+METRICS_MAX_BYTES = int(os.environ.get('METRICS_MAX_BYTES', str(5 * 1024 * 1024)))
+METRICS_BACKUPS = int(os.environ.get('METRICS_BACKUPS', '3'))
+METRICS_WINDOW = int(os.environ.get('METRICS_WINDOW', '2048'))
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))  # 0 = no HTTP endpoint
+
+QUANTILES = (0.5, 0.95, 0.99)
+TOKEN_FIELDS = ("prompt_tokens", "response_tokens")
+
+
+def _quantile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+class Span:
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.fields = {}
+
+    def set(self, **fields):
+        self.fields.update({k: v for k, v in fields.items() if v is not None})
+
+
+class Metrics:
+    def __init__(self, path=METRICS_FILE, window=METRICS_WINDOW):
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        self._series = {}
+        self._logger = None
+
+    def _file_logger(self):
+        if self._logger is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            logger = logging.getLogger(f"metrics.{id(self)}")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=METRICS_MAX_BYTES,
+                                                           backupCount=METRICS_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def record(self, stage, seconds, labels=None, **fields):
+        labels = {k: str(v) for k, v in (labels or {}).items() if v is not None}
+        key = (stage, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"durations": deque(maxlen=self.window), "count": 0, "sum": 0.0,
+                          "tokens": {field: 0 for field in TOKEN_FIELDS}}
+                self._series[key] = series
+            series["durations"].append(seconds)
+            series["count"] += 1
+            series["sum"] += seconds
+            for field in TOKEN_FIELDS:
+                if isinstance(fields.get(field), int):
+                    series["tokens"][field] += fields[field]
+            logger = self._file_logger()
+        if logger:
+            logger.info(json.dumps({"ts": round(time.time(), 3), "stage": stage, "seconds": round(seconds, 6),
+                                    **labels, **fields}, ensure_ascii=False))
+
+    @contextmanager
+    def span(self, stage, **labels):
+        span = Span(stage, labels)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            self.record(stage, time.perf_counter() - started, labels, **span.fields)
+
+    def summary(self):
+        # Rows for the admin panel, slowest p95 first
+        with self._lock:
+            items = [(key, sorted(s["durations"]), s["count"], dict(s["tokens"])) for key, s in self._series.items()]
+        rows = []
+        for (stage, labels), durations, count, tokens in items:
+            row = {"stage": stage, **dict(labels), "count": count}
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}_ms"] = round(_quantile(durations, q) * 1000, 2)
+            for field in TOKEN_FIELDS:
+                if tokens[field]:
+                    row[f"avg_{field}"] = round(tokens[field] / count, 1)
+            rows.append(row)
+        rows.sort(key=lambda r: r["p95_ms"], reverse=True)
+        return rows
+
+    def prometheus_text(self):
+        with self._lock:
+            items = [(key, sorted(s["durations"]), s["count"], s["sum"], dict(s["tokens"]))
+                     for key, s in self._series.items()]
+        lines = [
+            "# HELP app_stage_seconds Duration of each pipeline stage.",
+            "# TYPE app_stage_seconds summary",
+        ]
+        token_lines = []
+        for (stage, labels), durations, count, total, tokens in sorted(items):
+            base = [("stage", stage)] + list(labels)
+            for q in QUANTILES:
+                lines.append(f"app_stage_seconds{{{_labels(base + [('quantile', str(q))])}}} {_quantile(durations, q):.6f}")
+            lines.append(f"app_stage_seconds_count{{{_labels(base)}}} {count}")
+            lines.append(f"app_stage_seconds_sum{{{_labels(base)}}} {total:.6f}")
+            for field in TOKEN_FIELDS:
+                if tokens[field]:
+                    kind = field.split('_')[0]
+                    token_lines.append(f"app_tokens_total{{{_labels(base + [('kind', kind)])}}} {tokens[field]}")
+        if token_lines:
+            lines += ["# HELP app_tokens_total Tokens reported by the model API.", "# TYPE app_tokens_total counter"]
+            lines += token_lines
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _labels(pairs):
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ",".join(f'{k}="{escape(v)}"' for k, v in pairs)
+
+
+def usage_tokens(response):
+    # Token counts reported by the API, if the response carries them
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return {}
+    return {"prompt_tokens": getattr(usage, 'prompt_token_count', None),
+            "response_tokens": getattr(usage, 'candidates_token_count', None)}
+
+
+def serve_prometheus(metrics, port):
+    # Minimal /metrics endpoint in a daemon thread
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics-http').start()
+    return server
+
+
+_default_metrics = None
+_default_lock = threading.Lock()
+
+
+def get_metrics():
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+            if METRICS_PORT:
+                try:
+                    serve_prometheus(_default_metrics, METRICS_PORT)
+                except OSError:
+                    pass  # Another process already serves the port
+        return _default_metrics
+
+
+def span(stage, **labels):
+    return get_metrics().span(stage, **labels)
@@ -0,0 +1,269 @@
+import json
+
+# Turns raw model output into a validated problem set.
+# repair_json() extracts and fixes the JSON object in one linear pass;
+# validate_problem_set() checks it against the schema and salvages what it can.
+# Problems that were fixed are reported as diagnostics instead of errors.
+
+def _next_significant(text, i):
+    n = len(text)
+    while i < n and text[i] in ' \t\r\n':
+        i += 1
+    return text[i] if i < n else ''
+
+
+def _closes_string(text, i):
+    # Is the quote at text[i] the end of the string, or a stray quote inside it?
+    nxt = _next_significant(text, i + 1)
+    if nxt in ('', ':', '}', ']'):
+        return True
+    if nxt == ',':
+        after = _next_significant(text, text.index(',', i + 1) + 1)
+        return after in ('', '"', '{', '[', '}', ']')
+    if nxt == '"':
+        # Missing comma before the next key: "title": "T" "passage": ...
+        key_start = text.index('"', i + 1)
+        key_end = text.find('"', key_start + 1)
+        return key_end > 0 and _next_significant(text, key_end + 1) == ':'
+    return False
+
+
+def repair_json(text):
+    # Returns (repaired_text, diagnostics). Starts at the first "{" so code
+    # fences and chatter around the object are dropped, stops when it closes.
+    diagnostics = []
+    start = text.find('{')
+    if start < 0:
+        return "", ["JSON 객체를 찾을 수 없습니다."]
+    if text[:start].strip().strip('`').strip() not in ('', 'json'):
+        diagnostics.append("JSON 앞의 불필요한 텍스트를 제거했습니다.")
+
+    out = []
+    stack = []  # [container, state, rollback]; state: key/colon/value/comma
+    in_string = False
+    escape = False
+    pending_comma = None
+    i = start
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if in_string:
+            if escape:
+                escape = False
+                out.append(c)
+            elif c == '\\':
+                escape = True
+                out.append(c)
+            elif c == '"':
+                if _closes_string(text, i):
+                    in_string = False
+                    out.append(c)
+                    _after_value(stack)
+                else:
+                    out.append('\\"')
+                    diagnostics.append("문자열 안의 따옴표를 이스케이프했습니다.")
+            elif c == '\n':
+                out.append('\\n')
+            elif c == '\t':
+                out.append('\\t')
+            elif c < ' ':
+                pass
+            else:
+                out.append(c)
+            i += 1
+            continue
+
+        if c in ' \t\r\n':
+            i += 1
+            continue
+
+        if c == ',':
+            if pending_comma is None:
+                pending_comma = len(out)
+            i += 1
+            continue
+
+        if c in '}]':
+            if pending_comma is not None:
+                diagnostics.append("불필요한 쉼표(trailing comma)를 제거했습니다.")
+                pending_comma = None
+            if not stack:
+                i += 1
+                continue
+            container = stack[-1][0]
+            if stack[-1][1] in ('colon', 'value') and container == '{':
+                # Key without a value: drop it
+                del out[stack[-1][2]:]
+                diagnostics.append("값이 없는 키를 제거했습니다.")
+            stack.pop()
+            out.append('}' if container == '{' else ']')
+            if container != ('{' if c == '}' else '['):
+                diagnostics.append("괄호 짝이 맞지 않아 수정했습니다.")
+            _after_value(stack)
+            i += 1
+            if not stack:
+                break
+            continue
+
+        # A new token starts here
+        if stack and stack[-1][1] == 'comma' and c != ':':
+            if pending_comma is None:
+                diagnostics.append("빠진 쉼표를 추가했습니다.")
+            out.append(',')
+            stack[-1][1] = 'key' if stack[-1][0] == '{' else 'value'
+        elif pending_comma is not None:
+            diagnostics.append("불필요한 쉼표를 제거했습니다.")
+        pending_comma = None
+
+        if stack and stack[-1][1] == 'key':
+            stack[-1][2] = len(out) - (1 if out and out[-1] == ',' else 0)
+
+        if c == ':':
+            if stack and stack[-1][1] == 'colon':
+                stack[-1][1] = 'value'
+            out.append(c)
+        elif c == '"':
+            in_string = True
+            out.append(c)
+            if stack and stack[-1][1] == 'key':
+                # Closing the key string moves the state on to 'colon'
+                stack[-1][1] = 'key_string'
+        elif c in '{[':
+            out.append(c)
+            stack.append([c, 'key' if c == '{' else 'value', len(out)])
+        else:
+            # Bare literal: number, true/false/null
+            j = i
+            while j < n and text[j] not in ',}] \t\r\n':
+                j += 1
+            out.append(text[i:j])
+            _after_value(stack)
+            i = j
+            continue
+        i += 1
+
+    if in_string:
+        out.append('"')
+        _after_value(stack)
+        diagnostics.append("잘린 문자열을 닫았습니다.")
+    if stack:
+        diagnostics.append("응답이 중간에 잘려 열린 괄호를 닫았습니다.")
+        while stack:
+            container, state, rollback = stack.pop()
+            if container == '{' and state in ('key_string', 'colon', 'value'):
+                del out[rollback:]
+            out.append('}' if container == '{' else ']')
+            _after_value(stack)
+    return "".join(out), diagnostics
+
+
+def _after_value(stack):
+    if not stack:
+        return
+    state = stack[-1][1]
+    if state == 'key_string':
+        stack[-1][1] = 'colon'
+    elif state in ('value', 'key'):
+        stack[-1][1] = 'comma'
+
+
+def _as_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return "\n".join(_as_text(v) for v in value)
+    return str(value).strip()
+
+
+def validate_problem_set(data):
+    # Returns (problem_set or None, diagnostics). Invalid questions or
+    # vocabulary entries are dropped; the set is rejected only if no passage
+    # or no usable question remains.
+    diagnostics = []
+    if not isinstance(data, dict):
+        return None, ["응답이 JSON 객체가 아닙니다."]
+
+    result = dict(data)
+    result["title"] = _as_text(data.get("title")) or "Reading Passage"
+    if not data.get("title"):
+        diagnostics.append("제목(title)이 없어 기본값을 사용했습니다.")
+    result["passage"] = _as_text(data.get("passage"))
+    if not result["passage"] and not data.get("sections"):
+        return None, diagnostics + ["지문(passage)이 없습니다."]
+
+    questions = []
+    raw_questions = data.get("questions")
+    if isinstance(raw_questions, dict):
+        raw_questions = [raw_questions]
+    for idx, q in enumerate(raw_questions if isinstance(raw_questions, list) else []):
+        question, problems = validate_question(q, idx)
+        diagnostics.extend(problems)
+        if question is not None:
+            questions.append(question)
+    if not questions:
+        return None, diagnostics + ["사용할 수 있는 문제가 없습니다."]
+    result["questions"] = questions
+
+    if data.get("vocabulary") is None:
+        diagnostics.append("어휘 목록(vocabulary)이 없습니다.")
+    result["vocabulary"] = validate_vocabulary(data.get("vocabulary"))
+    return result, diagnostics
+
+
+def validate_question(q, idx=0):
+    # Returns (question or None, diagnostics)
+    if not isinstance(q, dict):
+        return None, [f"{idx+1}번 문제 형식이 잘못되어 제외했습니다."]
+    options = q.get("options")
+    if isinstance(options, str):
+        options = [line.strip() for line in options.splitlines() if line.strip()]
+    if not isinstance(options, list) or len(options) < 2:
+        return None, [f"{idx+1}번 문제의 선택지가 부족해 제외했습니다."]
+    answer = _as_text(q.get("answer"))
+    if not answer:
+        return None, [f"{idx+1}번 문제에 정답이 없어 제외했습니다."]
+    question = dict(q)
+    question["question"] = _as_text(q.get("question"))
+    question["options"] = [_as_text(o) for o in options]
+    question["answer"] = answer
+    question["type"] = _as_text(q.get("type"))
+    question["explanation"] = _as_text(q.get("explanation"))
+    if not question["explanation"]:
+        return question, [f"{idx+1}번 문제에 해설이 없습니다."]
+    return question, []
+
+
+def validate_vocabulary(raw_vocab):
+    if isinstance(raw_vocab, dict):
+        # {"word": "meaning", ...}
+        raw_vocab = [{"word": w, "meaning": m} for w, m in raw_vocab.items()]
+    vocabulary = []
+    for v in raw_vocab if isinstance(raw_vocab, list) else []:
+        if isinstance(v, dict) and _as_text(v.get("word")):
+            vocabulary.append({**v, "word": _as_text(v.get("word")), "meaning": _as_text(v.get("meaning"))})
+    return vocabulary
+
+
+def parse_json_object(text):
+    # Returns (object or None, diagnostics), repairing only if plain parsing fails
+    try:
+        return json.loads(text), []
+    except ValueError:
+        repaired, diagnostics = repair_json(text)
+        try:
+            return json.loads(repaired), diagnostics
+        except ValueError as e:
+            return None, _unique(diagnostics + [f"JSON을 복구하지 못했습니다: {e}"])
+
+
+def parse_problem_set(text):
+    # Returns (problem_set or None, diagnostics)
+    data, diagnostics = parse_json_object(text)
+    if data is None:
+        return None, diagnostics
+    result, problems = validate_problem_set(data)
+    return result, _unique(diagnostics + problems)
+
+
+def _unique(messages):
+    return list(dict.fromkeys(messages))
@@ -0,0 +1,114 @@
+import os
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ratelimit import RateLimiter
+
+# Background pool of ready-to-serve problem sets for the most requested
+# (school_level, grade, difficulty_level, question_type) combinations.
+# Difficulty is part of the key because it changes the prompt.
+# Speculative generations are paid for by the pool's API key, so each key
+# gets its own pool, and the whole feature is opt-in.
+
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', '0') == '1'
+PREFETCH_DEPTH = int(os.environ.get('PREFETCH_DEPTH', '2'))
+PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY', '2'))
+PREFETCH_PER_MINUTE = int(os.environ.get('PREFETCH_PER_MINUTE', '4'))
+PREFETCH_MAX_KEYS = int(os.environ.get('PREFETCH_MAX_KEYS', '6'))
+
+
+def make_pool_key(school_level, grade, difficulty_level, question_type):
+    return (school_level, grade, difficulty_level, question_type)
+
+
+class PrefetchPool:
+    def __init__(self, generate_fn, topics, api_key, depth=PREFETCH_DEPTH, concurrency=PREFETCH_CONCURRENCY,
+                 per_minute=PREFETCH_PER_MINUTE, max_keys=PREFETCH_MAX_KEYS):
+        # generate_fn has the signature of generate_problem_set
+        self.generate_fn = generate_fn
+        self.topics = list(topics)
+        self.depth = depth
+        self.max_keys = max_keys
+        self.limiter = RateLimiter(per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._pending = Counter()
+        self._requests = Counter()
+        self._topic_cursor = Counter()
+        self._api_key = api_key
+        self._stats = {"served": 0, "empty": 0, "generated": 0, "failed": 0}
+
+    def record_request(self, key):
+        with self._lock:
+            self._requests[key] += 1
+        self.refill()
+
+    def pop(self, key, topic=None):
+        # topic=None serves any recommended topic that is ready
+        with self._lock:
+            queue = self._queues.get(key)
+            item = None
+            if queue:
+                if topic is None:
+                    item = queue.popleft()
+                else:
+                    for candidate in queue:
+                        if candidate["topic"] == topic:
+                            item = candidate
+                            queue.remove(candidate)
+                            break
+            self._stats["served" if item else "empty"] += 1
+        self.refill()
+        return item
+
+    def refill(self):
+        with self._lock:
+            if not self._api_key:
+                return
+            hot_keys = [key for key, _ in self._requests.most_common(self.max_keys)]
+            for key in hot_keys:
+                queue = self._queues.setdefault(key, deque())
+                missing = self.depth - len(queue) - self._pending[key]
+                for _ in range(max(0, missing)):
+                    self._pending[key] += 1
+                    self._executor.submit(self._fill_one, key, self._next_topic(key), self._api_key)
+
+    def status(self):
+        with self._lock:
+            return {
+                "ready": {key: len(queue) for key, queue in self._queues.items() if queue},
+                "pending": {key: n for key, n in self._pending.items() if n},
+                "budget_left": self.limiter.available(),
+                **self._stats,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Internals ---
+    def _next_topic(self, key):
+        # Rotate through TOPICS so one key's queue holds different topics
+        index = self._topic_cursor[key] % len(self.topics)
+        self._topic_cursor[key] += 1
+        return self.topics[index]
+
+    def _fill_one(self, key, topic, api_key):
+        try:
+            self.limiter.acquire()
+            school_level, grade, difficulty_level, question_type = key
+            # Skip the response cache: the point of the pool is fresh sets
+            result = self.generate_fn(api_key, school_level, grade, topic, difficulty_level, question_type, use_cache=False)
+            with self._lock:
+                if "error" in result:
+                    self._stats["failed"] += 1
+                else:
+                    self._queues.setdefault(key, deque()).append({"topic": topic, "data": result})
+                    self._stats["generated"] += 1
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+        finally:
+            with self._lock:
+                self._pending[key] -= 1
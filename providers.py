@@ -0,0 +1,269 @@
+import json
+import os
+import random
+import threading
+import time
+
+from gemini_client import GEMINI_TIMEOUT, get_client
+
+# Pluggable LLM backends behind one generate(prompt, stream) call.
+#   gemini  - google.generativeai through gemini_client (404 fallback, hedging)
+#   openai  - any OpenAI-compatible /chat/completions API over pooled httpx
+#   local   - the same protocol against a self-hosted server (vLLM, llama.cpp, ...)
+# Backend libraries (google.generativeai, httpx) are imported on first use,
+# so only the ones a request actually reaches cost import time and memory.
+# With several backends configured the router sends each request to the one
+# with the lowest observed latency. Responses and streams carry `model_name`,
+# the model that actually answered, for cache keys.
+
+LLM_PROVIDERS = [p.strip() for p in os.environ.get('LLM_PROVIDERS', 'gemini').split(',') if p.strip()]
+
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', '120'))
+
+LOCAL_LLM_URL = os.environ.get('LOCAL_LLM_URL', 'http://localhost:8000/v1')
+LOCAL_LLM_MODEL = os.environ.get('LOCAL_LLM_MODEL', 'local-model')
+LOCAL_LLM_TIMEOUT = float(os.environ.get('LOCAL_LLM_TIMEOUT', '300'))
+# Not every local server supports response_format
+LOCAL_LLM_JSON_MODE = os.environ.get('LOCAL_LLM_JSON_MODE', '1') == '1'
+
+ROUTER_EWMA_ALPHA = float(os.environ.get('ROUTER_EWMA_ALPHA', '0.3'))
+ROUTER_COOLDOWN_SECONDS = float(os.environ.get('ROUTER_COOLDOWN_SECONDS', '60'))
+# Share of requests sent to a random backend so stale latencies get refreshed
+ROUTER_EXPLORE = float(os.environ.get('ROUTER_EXPLORE', '0.05'))
+
+
+class ProviderError(Exception):
+    pass
+
+
+class Usage:
+    # Same attribute names as Gemini's usage_metadata, for metrics.usage_tokens
+    def __init__(self, prompt_tokens=None, response_tokens=None):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = response_tokens
+
+
+class ModelResponse:
+    def __init__(self, text, usage=None, model_name=None):
+        self.text = text
+        self.usage_metadata = usage
+        self.model_name = model_name
+
+
+class ModelStream:
+    def __init__(self, chunks, model_name):
+        self._chunks = chunks
+        self.model_name = model_name
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+# --- Backends ---
+class GeminiProvider:
+    def __init__(self, api_key, model_name, generation_config=None):
+        self.name = "gemini"
+        self.api_key = api_key
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.timeout = GEMINI_TIMEOUT
+
+    def _client(self):
+        return get_client(self.api_key, self.model_name, self.generation_config)
+
+    def current_model(self):
+        return self._client().current_model()
+
+    def generate(self, prompt, stream=False):
+        response, model_name = self._client().generate_with_model(prompt, stream=stream)
+        if stream:
+            return ModelStream(response, model_name)
+        return ModelResponse(response.text, response.usage_metadata, model_name)
+
+
+class OpenAICompatibleProvider:
+    def __init__(self, name, base_url, model, api_key=None, timeout=120, json_mode=True):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.json_mode = json_mode
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _http(self):
+        # One pooled client per backend: connections are reused across requests
+        with self._lock:
+            if self._client is None:
+                import httpx
+                headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+                self._client = httpx.Client(
+                    base_url=self.base_url, headers=headers,
+                    timeout=httpx.Timeout(self.timeout, connect=10.0),
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                )
+            return self._client
+
+    def current_model(self):
+        return f"{self.name}/{self.model}"
+
+    def _body(self, prompt, stream):
+        body = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+        if self.json_mode:
+            body["response_format"] = {"type": "json_object"}
+        if stream:
+            body["stream"] = True
+            body["stream_options"] = {"include_usage": True}
+        return body
+
+    def generate(self, prompt, stream=False):
+        if stream:
+            return ModelStream(self._stream(prompt), self.current_model())
+        response = self._http().post("/chat/completions", json=self._body(prompt, False))
+        if response.status_code >= 400:
+            raise ProviderError(f"{response.status_code} {self.name}: {response.text[:500]}")
+        data = response.json()
+        usage = data.get("usage") or {}
+        return ModelResponse(data["choices"][0]["message"]["content"] or "",
+                             Usage(usage.get("prompt_tokens"), usage.get("completion_tokens")), self.current_model())
+
+    def _stream(self, prompt):
+        # Server-sent events; the last chunk carries the token usage
+        with self._http().stream("POST", "/chat/completions", json=self._body(prompt, True)) as response:
+            if response.status_code >= 400:
+                raise ProviderError(f"{response.status_code} {self.name}: {response.read()[:500].decode('utf-8', 'replace')}")
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                event = json.loads(payload)
+                choices = event.get("choices") or []
+                text = (choices[0].get("delta") or {}).get("content") or "" if choices else ""
+                usage = event.get("usage")
+                yield ModelResponse(text, Usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+                                    if usage else None)
+
+
+# --- Routing ---
+class ProviderRouter:
+    # Ranks backends by an exponentially weighted moving average of their
+    # latency (time to first chunk for streams, total time otherwise). A
+    # failure counts as a timeout-length sample and benches the backend for
+    # ROUTER_COOLDOWN_SECONDS; the request moves on to the next backend.
+    def __init__(self, providers, alpha=ROUTER_EWMA_ALPHA, cooldown=ROUTER_COOLDOWN_SECONDS, explore=ROUTER_EXPLORE):
+        self.providers = providers
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.explore = explore
+        self._lock = threading.Lock()
+        self._latency = {}  # (name, streamed) -> EWMA seconds
+        self._benched_until = {}
+        self._stats = {p.name: {"requests": 0, "failures": 0} for p in providers}
+
+    def _record(self, name, streamed, seconds):
+        with self._lock:
+            key = (name, streamed)
+            previous = self._latency.get(key)
+            self._latency[key] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def _fail(self, provider, streamed):
+        self._record(provider.name, streamed, provider.timeout)
+        with self._lock:
+            self._stats[provider.name]["failures"] += 1
+            self._benched_until[provider.name] = time.monotonic() + self.cooldown
+
+    def ranked(self, streamed=False, explore=True):
+        now = time.monotonic()
+        with self._lock:
+            # Unmeasured backends first (to get a sample), benched ones last
+            order = sorted(self.providers, key=lambda p: (
+                self._benched_until.get(p.name, 0) > now,
+                self._latency.get((p.name, streamed), 0.0),
+            ))
+        if explore and len(order) > 1 and random.random() < self.explore:
+            order.insert(0, order.pop(random.randrange(1, len(order))))
+        return order
+
+    def generate(self, prompt, stream=False):
+        last_error = None
+        for provider in self.ranked(stream):
+            with self._lock:
+                self._stats[provider.name]["requests"] += 1
+            started = time.monotonic()
+            try:
+                if not stream:
+                    response = provider.generate(prompt)
+                    self._record(provider.name, False, time.monotonic() - started)
+                    return response
+                # Fail over only until the first chunk; after that the
+                # caller already has part of the answer
+                stream_response = provider.generate(prompt, stream=True)
+                chunks = iter(stream_response)
+                first = next(chunks)
+                self._record(provider.name, True, time.monotonic() - started)
+                return ModelStream(_prepend(first, chunks), stream_response.model_name)
+            except Exception as e:
+                last_error = e
+                self._fail(provider, stream)
+        if last_error is None:
+            raise ProviderError("사용할 수 있는 모델 백엔드가 없습니다. (LLM_PROVIDERS 설정을 확인하세요)")
+        raise last_error
+
+    def current_model(self, streamed=False):
+        # The model a request would most likely reach now, for cache lookups
+        order = self.ranked(streamed, explore=False)
+        return order[0].current_model() if order else None
+
+    def status(self):
+        with self._lock:
+            now = time.monotonic()
+            return [{"provider": p.name,
+                     "latency_s": round(self._latency[(p.name, False)], 3) if (p.name, False) in self._latency else None,
+                     "ttfb_s": round(self._latency[(p.name, True)], 3) if (p.name, True) in self._latency else None,
+                     "benched": self._benched_until.get(p.name, 0) > now,
+                     **self._stats[p.name]} for p in self.providers]
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
+
+
+def make_providers(api_key, gemini_model, generation_config=None, names=None):
+    providers = []
+    for name in names or LLM_PROVIDERS:
+        if name == "gemini":
+            if api_key:
+                providers.append(GeminiProvider(api_key, gemini_model, generation_config))
+        elif name == "openai":
+            if OPENAI_API_KEY:
+                providers.append(OpenAICompatibleProvider("openai", OPENAI_BASE_URL, OPENAI_MODEL,
+                                                          api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT))
+        elif name == "local":
+            providers.append(OpenAICompatibleProvider("local", LOCAL_LLM_URL, LOCAL_LLM_MODEL,
+                                                      timeout=LOCAL_LLM_TIMEOUT, json_mode=LOCAL_LLM_JSON_MODE))
+        else:
+            raise ValueError(f"unknown LLM provider {name!r} in LLM_PROVIDERS")
+    return providers
+
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(api_key, gemini_model, generation_config=None):
+    key = (api_key, gemini_model, repr(generation_config))
+    with _routers_lock:
+        if key not in _routers:
+            _routers[key] = ProviderRouter(make_providers(api_key, gemini_model, generation_config))
+        return _routers[key]
+
+
+def needs_gemini_key():
+    return "gemini" in LLM_PROVIDERS and not (set(LLM_PROVIDERS) - {"gemini"})
@@ -0,0 +1,201 @@
+import os
+from string import Template
+
+# Question-type and grade-level registry. Every type is compiled into a
+# prompt template once at import; build_prompt() only substitutes the
+# per-request values and enforces the type's token budget.
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '1100'))
+
+# (school_level, grade) -> base difficulty standard. Unknown grades fall
+# back to the 3rd grade of the school level, as the original if/else did.
+GRADE_LEVELS = {
+    ("중학교", "1학년"): "Middle School Grade 1 Level. Length: 120-150 words. Vocab: ~800 words. Basic sentence structures.",
+    ("중학교", "2학년"): "Middle School Grade 2 Level. Length: 150-200 words. Vocab: ~1000 words. Comparison, Infinitives.",
+    ("중학교", "3학년"): "Middle School Grade 3 Level. Length: 200-250 words. Vocab: ~1250 words. Pre-High School difficulty. Relative clauses, passive voice.",
+    ("고등학교", "1학년"): "High School Grade 1 Level. Length: 250-350 words. Vocab: ~1800 words. Mock Exam standard. Complex sentence structures.",
+    ("고등학교", "2학년"): "High School Grade 2 Level. Length: 300-400 words. Vocab: ~2500 words. Abstract topics, Participial constructions.",
+    ("고등학교", "3학년"): "CSAT (SuNeung) Level. Length: 350-500 words. Vocab: 5000-8000 words level. Highly abstract, academic topics. Complex syntax. Vocabulary based on EBS SuNeung Teukgang.",
+}
+
+PROBLEM_SET_SCHEMA = """{
+"title": "Passage Title",
+"passage": "Full text...",
+"questions": [{"type": "Type Name", "question": "Question Text...", "options": ["1. A", "2. B", "3. C", "4. D", "5. E"], "answer": "3", "explanation": "..."}],
+"vocabulary": [{"word": "example word", "meaning": "예시 단어 뜻"}, {"word": "idiom", "meaning": "숙어 뜻"}]
+}"""
+
+FRAME = """You are an expert English teacher for Korean students, specialized in creating content for the Korean CSAT (Sooneung) and Mock Exams.
+Create a reading passage and QUESTIONS based on the following STRICT criteria:
+- **Topic**: $topic
+- **Target Audience**: Korean $school_level student, $grade
+- **Base Difficulty Standard**: $difficulty_guide
+- **Selected Question Type**: $question_type
+- **Specific Difficulty Adjustment**: $difficulty
+
+**Requirements**:
+1. Write an English reading passage that perfectly matches the requested difficulty and style.
+2. **Question Structure**:
+$type_instruction
+3. **CRITICAL - Handling Blanks/Context**: If a question asks to fill in a blank (Usage/Expression/Blank Inference), and the blank is NOT in the main passage, **you MUST include the specific sentence with the '_______' marker inside the 'question' field.**
+4. Provide the correct answer and a detailed explanation in Korean for each question.
+5. Extract 5-10 difficult vocabulary words or idioms from the passage and provide their Korean meanings.
+
+**Output Format**: Return ONLY a valid JSON object with the following structure:
+$schema"""
+
+GENERAL_INSTRUCTION = """- Create exactly 5 multiple-choice questions (5 options each) with VARIED formats (Avoid too many blanks):
+  - Q1: Main Idea/Title (Subject/Title).
+  - Q2: Detail/Content Match (Correct/Incorrect statement).
+  - Q3: Grammar (Error Finding). **Highlight 5 parts in the passage as (1)~(5)**. The options MUST include the highlighted word (e.g., "(1) live").
+  - Q4: Vocabulary Appropriateness. **Highlight 5 words in the passage as (a)~(e)**. The options MUST include the highlighted word (e.g., "(a) happy").
+  - Q5: Blank Inference. **Insert exactly ONE blank (_______)** in the passage. The question text should be simple (e.g., "다음 빈칸에 들어갈 말로 가장 적절한 것은?") WITHOUT quoting the sentence again."""
+
+LONG_41_42_INSTRUCTION = """- Create exactly 2 multiple-choice questions (Standard CSAT Q41-42 Format):
+  - Q1: Title Inference (제목 추론)
+  - Q2: Vocabulary appropriateness in context (문맥상 낱말의 쓰임) - **Mark target words as (a), (b), (c), (d), (e) in the passage.**
+- Passage Length: 500-600 words (Long Passage)."""
+
+LONG_43_45_INSTRUCTION = """- Create exactly 3 multiple-choice questions (Standard CSAT Q43-45 Format):
+  - Passage Structure: Divide the story into (A), (B), (C), (D) paragraphs.
+  - Q1: Order of paragraphs (B-D) following (A).
+  - Q2: Pointing Inference (Targeting pronouns a,b,c,d,e) - **Mark pronouns clearly in the text.**
+  - Q3: Content Match/Mismatch (내용 일치/불일치).
+- Passage Style: Narrative/Storytelling."""
+
+SINGLE_INSTRUCTION = """- **PRIMARY GOAL**: Create exactly 1 multiple-choice question modeled after **$question_type**.
+- **Passage Style**: Must perfectly suit the chosen type (e.g., for '빈칸추론', use high abstraction and logical gaps; for '심경', use descriptive/narrative tone).
+- **Question**: Create ONE perfect replica of the $question_type.
+  - **CRITICAL**: If the question type involves a blank ( 빈칸 ), you MUST insert the '_______' marker directly into the passage text.
+  - **CRITICAL - Standard Formatting**:
+    - **Grammar (어법)**: Mark targets in the passage as **(1) word**, **(2) word**, etc. (Number before word).
+    - **Vocabulary (어휘)**: Mark targets in the passage as **(a) word**, **(b) word**, etc. (Letter before word)."""
+
+HARD_UPGRADE = " (Upgrade to HARD/KILLER due to Question Type)"
+
+# name, instruction, expected question count, upgrade difficulty to hard,
+# shown in the generator selectbox. Types only used by the full mock exam
+# are registered too, so they get the same precompiled treatment.
+QUESTION_TYPE_TABLE = [
+    ("종합 (General Practice) - 5문제", GENERAL_INSTRUCTION, 5, False, True),
+    ("18-19번: 목적/심경 (1문제)", SINGLE_INSTRUCTION, 1, False, True),
+    ("20-24번: 대의파악 (주제/제목/요지) (1문제)", SINGLE_INSTRUCTION, 1, False, True),
+    ("21번: 함축의미 추론 (1문제)", SINGLE_INSTRUCTION, 1, True, True),
+    ("29번: 어법 (Grammar) (1문제)", SINGLE_INSTRUCTION, 1, False, True),
+    ("30번: 어휘 (Vocabulary) (1문제)", SINGLE_INSTRUCTION, 1, False, True),
+    ("31-34번: 빈칸추론 (Killer) (1문제)", SINGLE_INSTRUCTION, 1, True, True),
+    ("35번: 흐름과 관계없는 문장 (1문제)", SINGLE_INSTRUCTION, 1, False, True),
+    ("36-39번: 글의 순서/문장 삽입 (1문제)", SINGLE_INSTRUCTION, 1, True, True),
+    ("40번: 요약문 완성 (1문제)", SINGLE_INSTRUCTION, 1, False, True),
+    ("41-42번: 장문 독해 (2문제)", LONG_41_42_INSTRUCTION, 2, False, True),
+    ("43-45번: 복합 장문 (3문제)", LONG_43_45_INSTRUCTION, 3, False, True),
+    ("18번: 글의 목적 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("19번: 심경 변화 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("20번: 필자의 주장 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("22번: 글의 요지 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("23번: 글의 주제 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("24번: 글의 제목 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("25번: 도표 내용 불일치 (표의 수치를 지문에 글로 제시) (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("26번: 인물 내용 불일치 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("27번: 안내문 내용 불일치 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("28번: 안내문 내용 일치 (1문제)", SINGLE_INSTRUCTION, 1, False, False),
+    ("36-37번: 글의 순서 (1문제)", SINGLE_INSTRUCTION, 1, True, False),
+    ("38-39번: 문장 삽입 (1문제)", SINGLE_INSTRUCTION, 1, True, False),
+]
+
+
+def estimate_tokens(text):
+    # Rough count without a tokenizer: ~4 bytes of UTF-8 per token holds for
+    # both the English template and Korean text
+    return (len(text.encode('utf-8')) + 3) // 4
+
+
+class QuestionType:
+    def __init__(self, name, instruction, question_count, hard, listed, token_budget=PROMPT_TOKEN_BUDGET,
+                 schema=PROBLEM_SET_SCHEMA):
+        self.name = name
+        self.question_count = question_count
+        self.hard = hard
+        self.listed = listed
+        self.token_budget = token_budget
+        self.schema = schema
+        # Everything but the per-request values is substituted now; the name
+        # ends up inside the final template, so a "$" in it must stay literal
+        literal_name = name.replace("$", "$$")
+        instruction = Template(instruction).safe_substitute(question_type=literal_name)
+        self.template = Template(Template(FRAME).safe_substitute(
+            question_type=literal_name, type_instruction=instruction, schema=schema))
+        self.static_tokens = estimate_tokens(self.template.safe_substitute(
+            topic="", school_level="", grade="", difficulty_guide="", difficulty=""))
+
+    def render(self, school_level, grade, topic, difficulty_level):
+        difficulty_guide = grade_guide(school_level, grade)
+        if self.hard:
+            difficulty_level += HARD_UPGRADE
+        # The topic is the only free-form input, so it absorbs the budget
+        fixed = self.static_tokens + estimate_tokens(school_level + grade + difficulty_guide + difficulty_level)
+        room = max(0, (self.token_budget - fixed) * 4)
+        if len(topic.encode('utf-8')) > room:
+            topic = topic.encode('utf-8')[:room].decode('utf-8', 'ignore').rstrip()
+        return self.template.substitute(topic=topic, school_level=school_level, grade=grade,
+                                        difficulty_guide=difficulty_guide, difficulty=difficulty_level)
+
+
+def grade_guide(school_level, grade):
+    if school_level != "중학교":
+        school_level = "고등학교"
+    return GRADE_LEVELS.get((school_level, grade)) or GRADE_LEVELS[(school_level, "3학년")]
+
+
+def _load():
+    registry = {}
+    for name, instruction, question_count, hard, listed in QUESTION_TYPE_TABLE:
+        question_type = QuestionType(name, instruction, question_count, hard, listed)
+        if question_type.static_tokens > question_type.token_budget:
+            raise ValueError(f"prompt template for {name!r} is {question_type.static_tokens} tokens, "
+                             f"over its budget of {question_type.token_budget}")
+        registry[name] = question_type
+    return registry
+
+
+REGISTRY = _load()
+_unregistered = {}
+
+
+def infer_question_type(name):
+    # The keyword rules the original prompt builder applied to any type name
+    if "종합" in name:
+        return QuestionType(name, GENERAL_INSTRUCTION, 5, False, False)
+    if "41-42" in name:
+        return QuestionType(name, LONG_41_42_INSTRUCTION, 2, False, False)
+    if "43-45" in name:
+        return QuestionType(name, LONG_43_45_INSTRUCTION, 3, False, False)
+    hard = any(keyword in name for keyword in ("빈칸", "순서", "삽입", "함축"))
+    return QuestionType(name, SINGLE_INSTRUCTION, 1, hard, False)
+
+
+def get_question_type(name):
+    # Types outside the table (old history entries, batch specs) are
+    # compiled by the original keyword rules the first time they are seen
+    question_type = REGISTRY.get(name) or _unregistered.get(name)
+    if question_type is None:
+        question_type = infer_question_type(name)
+        _unregistered[name] = question_type
+    return question_type
+
+
+def listed_question_types():
+    return [name for name, question_type in REGISTRY.items() if question_type.listed]
+
+
+def prompt_size_report():
+    # Largest rendered prompt per type (longest grade guide, typical topic)
+    topic = "인공지능과 윤리 (AI & Ethics)"
+    rows = []
+    for name, question_type in REGISTRY.items():
+        sizes = [question_type.render(school_level, grade, topic, "중 (Medium)") for school_level, grade in GRADE_LEVELS]
+        largest = max(sizes, key=len)
+        tokens = estimate_tokens(largest)
+        rows.append({"question_type": name, "chars": len(largest), "est_tokens": tokens,
+                     "budget": question_type.token_budget, "used": f"{tokens / question_type.token_budget:.0%}"})
+    return rows
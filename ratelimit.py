@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+
+
+class RateLimiter:
+    # Token bucket: `per_minute` tokens are refilled evenly over a minute,
+    # and at most `burst` can be spent back to back.
+    def __init__(self, per_minute, burst=None):
+        self.per_minute = per_minute
+        self.capacity = burst if burst is not None else max(1, per_minute)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) * 60.0 / self.per_minute if self.per_minute > 0 else 1.0
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return int(self._tokens)
+
+
+# One bucket for every session and worker thread in the process, so the
+# API quota is respected no matter how many classrooms are generating.
+API_PER_MINUTE = int(os.environ.get('API_PER_MINUTE', '60'))
+API_BURST = int(os.environ.get('API_BURST', '10'))
+API_WAIT_SECONDS = float(os.environ.get('API_WAIT_SECONDS', '30'))
+
+_api_limiter = None
+_api_lock = threading.Lock()
+
+
+def get_api_limiter():
+    global _api_limiter
+    with _api_lock:
+        if _api_limiter is None:
+            _api_limiter = RateLimiter(API_PER_MINUTE, burst=API_BURST)
+        return _api_limiter
+
+
+def set_api_limiter(limiter):
+    # For offline benchmarks and tools that must not share the API quota
+    global _api_limiter
+    with _api_lock:
+        _api_limiter = limiter
@@ -0,0 +1,78 @@
+import functools
+import re
+
+# HTML builders for the problem-set view. They are memoized on their text
+# input, so Streamlit reruns (every radio click, the grade button) reuse the
+# HTML instead of redoing the regex passes and string building. The caches
+# live in this module so they survive reruns of app.py.
+
+_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC = re.compile(r'\*(.*?)\*')
+
+
+@functools.lru_cache(maxsize=256)
+def build_passage_html(passage_text):
+    # Convert Markdown to HTML for the box display
+    passage_text = passage_text.replace(chr(10), '<br>')
+    passage_text = _BOLD.sub(r'<b>\1</b>', passage_text) # Bold
+    passage_text = _ITALIC.sub(r'<i>\1</i>', passage_text) # Italic
+    
+    return f"""
+    <div style="
+        background-color: #FFFFFF;
+        padding: 25px;
+        border: 2px solid #333;
+        font-family: 'Times New Roman', serif;
+        font-size: 18px;
+        line-height: 1.8;
+        color: #000;
+        margin-bottom: 20px;
+    ">
+        {passage_text}
+    </div>
+    """
+
+
+def vocab_items(vocab_list):
+    # Hashable form of the vocabulary list, used as the memo key
+    return tuple((v.get('word', ''), v.get('meaning', '')) for v in vocab_list)
+
+
+@functools.lru_cache(maxsize=256)
+def build_vocab_html(vocab_items):
+    # Use HTML/JS for client-side TTS (Text-to-Speech)
+    vocab_html = """
+    <style>
+        .vocab-item { margin-bottom: 8px; font-family: sans-serif; font-size: 16px; display: flex; align-items: center; }
+        .speak-btn { 
+            background-color: #f0f2f6; border: 1px solid #dce4ef; border-radius: 4px; 
+            cursor: pointer; margin-right: 10px; padding: 2px 6px; font-size: 14px;
+        }
+        .speak-btn:hover { background-color: #e0e5eb; }
+    </style>
+    <script>
+        function speak(text) {
+            if ('speechSynthesis' in window) {
+                var msg = new SpeechSynthesisUtterance();
+                msg.text = text;
+                msg.lang = 'en-US';
+                window.speechSynthesis.speak(msg);
+            } else {
+                alert("이 브라우저는 TTS를 지원하지 않습니다.");
+            }
+        }
+    </script>
+    <div style="padding: 10px;">
+    """
+
+    for word, meaning in vocab_items:
+        word = word.replace("'", "\\'") # Escape quotes
+        vocab_html += f"""
+        <div class="vocab-item">
+            <button class="speak-btn" onclick="speak('{word}')">🔊</button>
+            <span><b>{word}</b> : {meaning}</span>
+        </div>
+        """
+
+    vocab_html += "</div>"
+    return vocab_html
@@ -0,0 +1,74 @@
+import copy
+import os
+import threading
+from concurrent.futures import Future
+
+# Process-wide request coalescing: while a call for a key is in flight,
+# identical calls wait for it and share its result instead of starting
+# their own. Nothing is remembered once the call finishes (that is the
+# cache's job).
+
+# How long a streaming follower waits before making its own call
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_WAIT_SECONDS', '180'))
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def begin(self, key):
+        # Returns (future, True) for the caller that must do the work, or the
+        # in-flight call's (future, False)
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats["followers"] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self._stats["leaders"] += 1
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        # Every caller gets its own copy, so one session editing its set
+        # can't change another's
+        future, leader = self.begin(key)
+        if leader:
+            try:
+                result = fn()
+            except BaseException as e:
+                self.finish(key, future, error=e)
+                raise
+            self.finish(key, future, result)
+            return copy.deepcopy(result)
+        return copy.deepcopy(future.result())
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+
+_default_flight = None
+_default_lock = threading.Lock()
+
+
+def get_single_flight():
+    global _default_flight
+    with _default_lock:
+        if _default_flight is None:
+            _default_flight = SingleFlight()
+        return _default_flight
@@ -0,0 +1,114 @@
+import json
+import re
+
+# Incremental parser for the problem-set JSON as it streams in from the model.
+# Each fed character is scanned exactly once; as soon as a top-level field
+# ("title", "passage", ...) or one element of "questions" closes, it is
+# decoded and reported so the UI can render it before the response ends.
+
+_TRAILING_COMMA = re.compile(r',\s*([\]}])')
+
+
+def _loads(fragment):
+    try:
+        return json.loads(fragment)
+    except ValueError:
+        try:
+            return json.loads(_TRAILING_COMMA.sub(r'\1', fragment))
+        except ValueError:
+            return None
+
+
+class ProblemSetStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.questions = []
+        self.done = False
+        self._pos = 0
+        self._stack = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = True
+        self._key = None
+        self._value_start = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        # Returns a list of events: ("field", key, value) or ("question", index, question)
+        self.text += chunk
+        events = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self.done:
+                break
+            self._step(text, i, text[i], events)
+        self._pos = len(text)
+        return events
+
+    def _step(self, text, i, c, events):
+        if not self._started:
+            # Skips ```json fences and any chatter before the object
+            if c == '{':
+                self._started = True
+                self._stack.append('{')
+            return
+
+        depth = len(self._stack)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif c == '\\':
+                self._escape = True
+            elif c == '"':
+                self._in_string = False
+                if depth == 1 and self._expect_key:
+                    self._key = _loads(text[self._string_start:i + 1])
+                    self._expect_key = False
+                elif depth == 1 and self._value_start is not None:
+                    self._emit_field(text[self._value_start:i + 1], events)
+            return
+
+        if c == '"':
+            self._in_string = True
+            self._string_start = i
+            if depth == 1 and not self._expect_key and self._value_start is None:
+                self._value_start = i
+        elif c in '{[':
+            if depth == 1 and self._value_start is None:
+                self._value_start = i
+            elif depth == 2 and c == '{' and self._key == 'questions' and self._stack[-1] == '[':
+                self._item_start = i
+            self._stack.append(c)
+        elif c in '}]':
+            self._stack.pop()
+            depth = len(self._stack)
+            if depth == 2 and c == '}' and self._item_start is not None:
+                question = _loads(text[self._item_start:i + 1])
+                if question is not None:
+                    self.questions.append(question)
+                    events.append(("question", len(self.questions) - 1, question))
+                self._item_start = None
+            elif depth == 1 and self._value_start is not None:
+                self._emit_field(text[self._value_start:i + 1], events)
+            elif depth == 0:
+                if self._value_start is not None:
+                    self._emit_field(text[self._value_start:i], events)
+                self.done = True
+        elif depth == 1:
+            if c == ',':
+                if self._value_start is not None:
+                    # Bare literal such as a number or true/false
+                    self._emit_field(text[self._value_start:i], events)
+                self._expect_key = True
+            elif not c.isspace() and c != ':' and not self._expect_key and self._value_start is None:
+                self._value_start = i
+
+    def _emit_field(self, fragment, events):
+        value = _loads(fragment.strip())
+        if value is not None and self._key is not None:
+            self.fields[self._key] = value
+            events.append(("field", self._key, value))
+        self._value_start = None
@@ -0,0 +1,213 @@
+import bisect
+import csv
+import io
+import threading
+from collections import Counter
+
+from history_store import get_history_store, grade_level, vocabulary_rows, word_key
+
+# In-memory inverted index over the vocabulary of every saved problem set:
+# word -> meanings, source sets and passage positions. It is loaded once
+# from the history store's vocabulary table and then updated by
+# save_to_history / delete_history_file, never by rescanning history.
+
+FUZZY_MAX_DISTANCE = 2
+
+
+def _grams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _distance(a, b, limit):
+    # Levenshtein distance, giving up once every cell exceeds `limit`
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class VocabIndex:
+    def __init__(self, rows=()):
+        self._lock = threading.Lock()
+        self._postings = {}  # word_key -> {set_id: (word, meaning, grade_level, position)}
+        self._keys = []      # sorted word keys, for prefix lookup
+        self._grams = {}     # trigram -> word keys, for fuzzy lookup
+        self._by_set = {}    # set_id -> word keys
+        # Rankings, levels and CSV decks are reused until the next add/remove,
+        # since the app asks for them on every rerun
+        self._version = 0
+        self._memo = {}
+        for set_id, key, word, meaning, level, position in rows:
+            self._add_row(set_id, key, word, meaning, level, position)
+
+    def _add_row(self, set_id, key, word, meaning, level, position):
+        postings = self._postings.get(key)
+        if postings is None:
+            postings = self._postings[key] = {}
+            bisect.insort(self._keys, key)
+            for gram in _grams(key):
+                self._grams.setdefault(gram, set()).add(key)
+        postings.setdefault(set_id, (word, meaning, level, position))
+        self._by_set.setdefault(set_id, set()).add(key)
+
+    def _changed(self):
+        self._version += 1
+        self._memo.clear()
+
+    def _memoized(self, key, compute):
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+            version = self._version
+        value = compute()
+        with self._lock:
+            if self._version == version:
+                self._memo[key] = value
+        return value
+
+    def _remove_set(self, set_id):
+        for key in self._by_set.pop(set_id, ()):
+            postings = self._postings[key]
+            postings.pop(set_id, None)
+            if not postings:
+                del self._postings[key]
+                del self._keys[bisect.bisect_left(self._keys, key)]
+                for gram in _grams(key):
+                    self._grams[gram].discard(key)
+
+    # --- Updates ---
+    def add(self, set_id, data, school_level=None, grade=None):
+        level = grade_level(school_level, grade)
+        with self._lock:
+            self._remove_set(set_id)
+            for key, word, meaning, position in vocabulary_rows(data):
+                self._add_row(set_id, key, word, meaning, level, position)
+            self._changed()
+
+    def remove(self, set_id):
+        with self._lock:
+            self._remove_set(set_id)
+            self._changed()
+
+    # --- Lookups ---
+    def _entry(self, key):
+        postings = self._postings[key]
+        meanings = []
+        for word, meaning, level, position in postings.values():
+            if meaning and meaning not in meanings:
+                meanings.append(meaning)
+        first = next(iter(postings.values()))
+        return {
+            "word": first[0],
+            "meanings": meanings,
+            "sets": len(postings),
+            "sources": [{"set_id": set_id, "grade_level": level, "position": position}
+                        for set_id, (word, meaning, level, position) in postings.items()],
+        }
+
+    def lookup(self, word):
+        with self._lock:
+            key = word_key(word)
+            return self._entry(key) if key in self._postings else None
+
+    def prefix(self, text, limit=20):
+        prefix = word_key(text)
+        if not prefix:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            matches = []
+            for key in self._keys[start:start + limit]:
+                if not key.startswith(prefix):
+                    break
+                matches.append(self._entry(key))
+        return matches
+
+    def fuzzy(self, text, limit=10, max_distance=FUZZY_MAX_DISTANCE):
+        # Candidates share a trigram with the query; closest first, then by use
+        query = word_key(text)
+        if not query:
+            return []
+        with self._lock:
+            shared = Counter()
+            for gram in _grams(query):
+                shared.update(self._grams.get(gram, ()))
+            scored = []
+            for key, _ in shared.most_common(limit * 20):
+                distance = _distance(query, key, max_distance)
+                if distance <= max_distance:
+                    scored.append((distance, -len(self._postings[key]), key))
+            scored.sort()
+            return [dict(self._entry(key), distance=distance) for distance, _, key in scored[:limit]]
+
+    def search(self, text, limit=20):
+        # Prefix matches first; fuzzy matches fill in typos
+        results = self.prefix(text, limit)
+        if len(results) < limit:
+            seen = {r["word"] for r in results}
+            results += [r for r in self.fuzzy(text, limit - len(results)) if r["word"] not in seen]
+        return results
+
+    def ranking(self, level=None, limit=50):
+        # Words by the number of sets they appear in, optionally for one grade level
+        return self._memoized(("ranking", level, limit), lambda: self._ranking(level, limit))
+
+    def _ranking(self, level, limit):
+        with self._lock:
+            counts = []
+            for key, postings in self._postings.items():
+                count = sum(1 for _, _, posting_level, _ in postings.values() if level is None or posting_level == level)
+                if count:
+                    counts.append((count, key))
+            counts.sort(key=lambda c: (-c[0], c[1]))
+            rows = []
+            for count, key in counts[:limit]:
+                entry = self._entry(key)
+                rows.append({"word": entry["word"], "sets": count, "meaning": " / ".join(entry["meanings"])})
+        return rows
+
+    def levels(self):
+        return self._memoized(("levels",), self._levels)
+
+    def _levels(self):
+        with self._lock:
+            return sorted({level for postings in self._postings.values()
+                           for _, _, level, _ in postings.values() if level})
+
+    def deck(self, level=None):
+        # One row per distinct word with every meaning it was given
+        return self.ranking(level, limit=None)
+
+    def deck_csv(self, level=None):
+        return self._memoized(("deck_csv", level), lambda: self._deck_csv(level))
+
+    def _deck_csv(self, level):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["word", "meaning", "sets"])
+        for row in self.deck(level):
+            writer.writerow([row["word"], row["meaning"], row["sets"]])
+        return out.getvalue()
+
+    def __len__(self):
+        return len(self._postings)
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_vocab_index():
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = VocabIndex(get_history_store().vocabulary())
+        return _default_index